@@ -0,0 +1,2 @@
+# Benchmarks for the Magic Number interpreter. Run them with
+# `python -m benchmarks` from the root of the repository; see suite.py.
@@ -0,0 +1,5 @@
+import sys
+
+from benchmarks import suite
+
+sys.exit(suite.main(sys.argv[1:]))
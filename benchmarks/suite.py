@@ -0,0 +1,303 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import magic_number_executer as MNE
+import magic_number_generator as MNG
+import magic_number_loops as MNL
+import magic_number_optimizer as MNO
+import magic_number_shared_program as MNSP
+import magic_number_snapshot as MNSS
+import magic_number_specializer as MNPE
+
+# The benchmark suite. Every program in samples/ and a set of scaled-up
+# synthetic programs are run through each execution engine, measuring load,
+# parse and run time, instructions executed per second, peak memory and the
+# overhead of debug mode. Results are written as JSON and compared against a
+# stored baseline so that slowdowns are flagged.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES_DIRECTORY = os.path.join(ROOT, "samples")
+DEFAULT_OUTPUT = os.path.join(ROOT, "bench_output.json")
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+# Input for the sample programs which read any. The truth machine is given a
+# zero, since given a one it never terminates.
+SAMPLE_INPUT = {"adder.magic" : ["3", "4"], "fizz_buzz.magic" : ["100"], \
+                "prime.magic" : ["17"], "truth_machine.magic" : ["0"]}
+
+# Version of the results format. Results of different versions are not compared.
+RESULTS_VERSION = 1
+
+# A program to benchmark: its name, its source as it would appear in a file,
+# including comments, and the lines of input it is given.
+class Workload:
+    def __init__(self, name, text, preset_input = []):
+        self.name = name
+        self.text = text
+        self.preset_input = preset_input
+
+# Return a workload for every program in samples/.
+def sample_workloads():
+    workloads = []
+    for file_name in sorted(os.listdir(SAMPLES_DIRECTORY)):
+        if not file_name.endswith(".magic"):
+            continue
+        with open(os.path.join(SAMPLES_DIRECTORY, file_name)) as source_file:
+            text = source_file.read()
+        workloads.append(Workload(file_name, text, \
+                                  SAMPLE_INPUT.get(file_name, [])))
+    return workloads
+
+# Sizes, in characters, of the synthetic programs of each shape at scale 1. Loop
+# bodies run many times, so the nested loop program is kept small.
+SYNTHETIC_SIZES = {"straight_line" : 64 * 1024, "comment_heavy" : 256 * 1024, \
+                   "input_heavy" : 64 * 1024, "stack_deep" : 32 * 1024, \
+                   "nested_loops" : 8 * 1024}
+
+# Options for the synthetic programs of each shape.
+SYNTHETIC_OPTIONS = {"nested_loops" : {"depth" : 3, "iterations" : 4}}
+
+# Return a synthetic workload of every shape from magic_number_generator.py,
+# with sizes multiplied by `scale`.
+def synthetic_workloads(scale = 1):
+    workloads = []
+    for shape, size in SYNTHETIC_SIZES.items():
+        generated = MNG.generate_workload(shape, size * scale, 0, \
+                                          **SYNTHETIC_OPTIONS.get(shape, {}))
+        name = "{}_{}K".format(shape, size * scale // 1024)
+        workloads.append(Workload(name, generated.source, \
+                                  generated.input_lines))
+    return workloads
+
+# Execution engines. Each prepares a compiled program and returns a function
+# which runs it given preset input and the debug flag, along with a function
+# releasing anything the preparation acquired.
+def prepare_reference_engine(source):
+    def run(preset_input, is_debugging):
+        MNE.run_interpreter_from_python(source, is_debugging, True, \
+                                        preset_input)
+    return run, lambda: None
+
+def prepare_snapshot_engine(source):
+    # Snapshots are taken up front; only the runs from them are measured
+    snapshots = {is_debugging : \
+                 MNSS.take_prefix_snapshot(source, is_debugging) \
+                 for is_debugging in (False, True)}
+    def run(preset_input, is_debugging):
+        MNSS.run_from_snapshot(snapshots[is_debugging], True, preset_input)
+    return run, lambda: None
+
+def prepare_shared_memory_engine(source):
+    program = MNSP.share_MN_program(source)
+    def run(preset_input, is_debugging):
+        MNSP.run_shared_MN_program(program.name, is_debugging, True, \
+                                   preset_input)
+    def release():
+        program.close()
+        program.unlink()
+    return run, release
+
+def prepare_specialized_engine(source):
+    # Specialization is done up front. Debugging runs are not specialized.
+    specialized = MNPE.specialize_MN_program(source)
+    def run(preset_input, is_debugging):
+        if is_debugging:
+            MNE.run_interpreter_from_python(source, True, True, preset_input)
+        else:
+            MNPE.run_specialized_program(specialized, True, preset_input)
+    return run, lambda: None
+
+def prepare_loop_accelerated_engine(source):
+    def run(preset_input, is_debugging):
+        MNL.run_accelerated_MN_program(source, is_debugging, True, \
+                                       preset_input)
+    return run, lambda: None
+
+def prepare_optimized_engine(source):
+    # Optimization is done up front; the optimized source is run as usual
+    optimized_source = MNO.optimize_MN_source(source)
+    def run(preset_input, is_debugging):
+        MNE.run_interpreter_from_python(optimized_source, is_debugging, True, \
+                                        preset_input)
+    return run, lambda: None
+
+ENGINES = {"reference" : prepare_reference_engine, \
+           "snapshot" : prepare_snapshot_engine, \
+           "shared_memory" : prepare_shared_memory_engine, \
+           "specialized" : prepare_specialized_engine, \
+           "loop_accelerated" : prepare_loop_accelerated_engine, \
+           "optimized" : prepare_optimized_engine}
+
+# Return the shortest time taken by `repeat` calls of `function`.
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+# Benchmark one workload on the given engines and return its results.
+def benchmark_workload(workload, engine_names, repeat = 3, \
+                       measure_debug = True):
+    results = {}
+    # Time loading from a file, comments and all
+    with tempfile.NamedTemporaryFile("w", suffix = ".magic", \
+                                     delete = False) as source_file:
+        source_file.write(workload.text)
+    try:
+        results["load_seconds"] = best_time( \
+            lambda: MNE.load_MN_file(source_file.name), repeat)
+        source = MNE.load_MN_file(source_file.name)
+    finally:
+        os.unlink(source_file.name)
+    results["source_digits"] = len(source)
+    results["parse_seconds"] = best_time( \
+        lambda: MNE.compile_MN_program(source), repeat)
+    results["engines"] = {}
+    # Program output and debugging information are not part of the benchmark
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for engine_name in engine_names:
+            run, release = ENGINES[engine_name](source)
+            try:
+                results["engines"][engine_name] = \
+                    benchmark_engine(run, workload.preset_input, repeat, \
+                                     measure_debug)
+            finally:
+                release()
+    return results
+
+# Benchmark running a prepared program on one engine.
+def benchmark_engine(run, preset_input, repeat, measure_debug):
+    results = {}
+    run_seconds = best_time(lambda: run(list(preset_input), False), repeat)
+    results["run_seconds"] = run_seconds
+    results["instructions"] = MNE.instructions_executed
+    results["instructions_per_second"] = \
+        MNE.instructions_executed / run_seconds if run_seconds > 0 else 0.0
+    if measure_debug:
+        debug_seconds = best_time(lambda: run(list(preset_input), True), \
+                                  repeat)
+        results["debug_run_seconds"] = debug_seconds
+        results["debug_overhead"] = \
+            debug_seconds / run_seconds if run_seconds > 0 else 0.0
+    # Measure memory separately, since tracing slows everything down
+    tracemalloc.start()
+    try:
+        run(list(preset_input), False)
+        results["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return results
+
+# Run the whole suite and return the results.
+def run_suite(workloads, engine_names, repeat = 3, measure_debug = True):
+    results = {"version" : RESULTS_VERSION, \
+               "python" : platform.python_version(), \
+               "timestamp" : time.time(), "workloads" : {}}
+    for workload in workloads:
+        results["workloads"][workload.name] = \
+            benchmark_workload(workload, engine_names, repeat, measure_debug)
+    return results
+
+# Compare results against a baseline, returning a description of each
+# measurement that got worse by more than `tolerance`, a fraction of the
+# baseline value. Workloads and engines missing from either side are ignored.
+def compare_to_baseline(results, baseline, tolerance = 0.1):
+    regressions = []
+    if baseline.get("version") != results.get("version"):
+        return regressions
+    # Record a regression if a measurement moved the wrong way by too much
+    def check(where, measurement, current, previous, lower_is_better):
+        if previous is None or current is None or previous == 0:
+            return
+        change = (current - previous) / previous
+        if not lower_is_better:
+            change = -change
+        if change > tolerance:
+            regressions.append("{}: {} went from {:.6g} to {:.6g} ({:+.1%})" \
+                               .format(where, measurement, previous, current, \
+                                       (current - previous) / previous))
+    for name, workload in results["workloads"].items():
+        previous_workload = baseline["workloads"].get(name)
+        if previous_workload is None:
+            continue
+        for measurement in ("load_seconds", "parse_seconds"):
+            check(name, measurement, workload.get(measurement), \
+                  previous_workload.get(measurement), True)
+        for engine_name, engine in workload["engines"].items():
+            previous_engine = previous_workload["engines"].get(engine_name)
+            if previous_engine is None:
+                continue
+            where = "{} [{}]".format(name, engine_name)
+            check(where, "instructions_per_second", \
+                  engine.get("instructions_per_second"), \
+                  previous_engine.get("instructions_per_second"), False)
+            for measurement in ("peak_memory_bytes", "debug_overhead"):
+                check(where, measurement, engine.get(measurement), \
+                      previous_engine.get(measurement), True)
+    return regressions
+
+# Print a table summarising the results.
+def print_results(results):
+    print("{:<28} {:<14} {:>12} {:>12} {:>14} {:>10}".format( \
+          "workload", "engine", "parse (s)", "run (s)", "instr/s", \
+          "peak (KiB)"))
+    for name, workload in results["workloads"].items():
+        for engine_name, engine in workload["engines"].items():
+            print("{:<28} {:<14} {:>12.6f} {:>12.6f} {:>14.0f} {:>10.1f}" \
+                  .format(name, engine_name, workload["parse_seconds"], \
+                          engine["run_seconds"], \
+                          engine["instructions_per_second"], \
+                          engine["peak_memory_bytes"] / 1024))
+
+def main(arguments):
+    parser = argparse.ArgumentParser(prog = "python -m benchmarks", \
+        description = "Benchmark the Magic Number interpreter.")
+    parser.add_argument("--engine", action = "append", choices = ENGINES, \
+                        help = "engine to benchmark; may be repeated " \
+                        "(default: all)")
+    parser.add_argument("--scale", type = int, default = 1, \
+                        help = "size multiplier for synthetic programs")
+    parser.add_argument("--repeat", type = int, default = 3, \
+                        help = "runs per measurement; the fastest is kept")
+    parser.add_argument("--no-debug", action = "store_true", \
+                        help = "skip measuring debug mode overhead")
+    parser.add_argument("--output", default = DEFAULT_OUTPUT, \
+                        help = "where to write the results as JSON")
+    parser.add_argument("--baseline", default = DEFAULT_BASELINE, \
+                        help = "results to compare against")
+    parser.add_argument("--save-baseline", action = "store_true", \
+                        help = "store these results as the new baseline")
+    parser.add_argument("--tolerance", type = float, default = 0.1, \
+                        help = "allowed slowdown before a regression is " \
+                        "reported, as a fraction")
+    options = parser.parse_args(arguments)
+    engine_names = options.engine or list(ENGINES)
+    workloads = sample_workloads() + synthetic_workloads(options.scale)
+    results = run_suite(workloads, engine_names, options.repeat, \
+                        not options.no_debug)
+    print_results(results)
+    with open(options.output, "w") as output_file:
+        json.dump(results, output_file, indent = 2)
+    if options.save_baseline:
+        with open(options.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent = 2)
+        return 0
+    if not os.path.exists(options.baseline):
+        return 0
+    with open(options.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare_to_baseline(results, baseline, options.tolerance)
+    for regression in regressions:
+        print("REGRESSION " + regression, file = sys.stderr)
+    return 1 if regressions else 0
@@ -0,0 +1,168 @@
+#!/bin/python3
+
+import concurrent.futures
+import json
+import sys
+
+import magic_number_cache as MNC
+import magic_number_daemon as MND
+import magic_number_metrics as MNM
+
+# Batch execution of MN programs. Jobs are read as JSON lines from a file or
+# standard in, run with a bounded number of jobs in flight, and their results
+# are written as JSON lines as soon as each finishes, so memory use does not
+# grow with the number of jobs.
+#
+# A job names a program by "path" or gives its "source", with optional "input"
+# lines, "options" limiting the run and an "id" which is copied to its result:
+#   {"id": 1, "path": "samples/adder.magic", "input": ["3", "4"]}
+# Jobs, their options and their results have the same form as the requests and
+# responses of magic_number_daemon.py: the "output", final "stack", "status",
+# number of "instructions" executed and "elapsed" seconds, or an "error".
+# Results are written in the order jobs finish. Metrics covering every job can
+# be written to a file in the Prometheus text format when the batch is done.
+
+# Compiled programs of the jobs run by this process. Each worker process has
+# its own, so jobs sharing a program are parsed once per worker.
+programs = MNC.MNProgramCache()
+
+# Run one job and return its result.
+def run_job(job):
+    result = MND.run_program_request(job, programs)
+    if "id" in job:
+        result["id"] = job["id"]
+    return result
+
+# Yield the jobs in a stream of JSON lines. Lines which are not valid jobs are
+# yielded as results describing the problem instead.
+def read_jobs(stream):
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError as error:
+            yield None, {"line" : line_number, \
+                         "error" : "bad job: {}".format(error)}
+            continue
+        if not isinstance(job, dict):
+            yield None, {"line" : line_number, \
+                         "error" : "bad job: not a JSON object"}
+            continue
+        job.setdefault("id", line_number)
+        yield job, None
+
+# Return the result of a job whose worker process died while running it.
+def crashed_job_result(job, error):
+    return {"id" : job["id"], \
+            "error" : "worker process crashed: {}".format(error)}
+
+# Write one result as a JSON line.
+def write_result(result, output_stream):
+    output_stream.write(json.dumps(result) + "\n")
+    output_stream.flush()
+
+# Run every job in a stream of JSON lines, writing results to another stream.
+# With `workers` of zero, jobs run one after another in this process, otherwise
+# they run in that many worker processes with at most `max_in_flight` jobs
+# submitted but not yet finished. Every result is recorded in `metrics`, if
+# given. Return the number of jobs run.
+def run_batch(input_stream, output_stream, workers = 0, max_in_flight = None, \
+              metrics = None):
+    jobs_run = 0
+    def finish(result):
+        if metrics is not None:
+            metrics.record(result)
+        write_result(result, output_stream)
+    if workers == 0:
+        for job, problem in read_jobs(input_stream):
+            if problem is not None:
+                write_result(problem, output_stream)
+                continue
+            finish(run_job(job))
+            jobs_run += 1
+        return jobs_run
+    if max_in_flight is None:
+        max_in_flight = 2 * workers
+    # Submitted jobs not yet finished, by their futures
+    in_flight = {}
+    executor = concurrent.futures.ProcessPoolExecutor(workers)
+    # Finish the jobs in flight which are done, waiting as `return_when` says.
+    # If a worker process died, the pool is broken and every job in flight
+    # fails with it, so each is run again on its own in a new pool, to find
+    # the one which brings the pool down and finish the others.
+    def collect(return_when):
+        nonlocal executor
+        done, _ = concurrent.futures.wait(in_flight, return_when = return_when)
+        broken = []
+        for future in done:
+            job = in_flight.pop(future)
+            try:
+                finish(future.result())
+            except concurrent.futures.process.BrokenProcessPool:
+                broken.append(job)
+        if not broken:
+            return
+        done, _ = concurrent.futures.wait(in_flight)
+        for future in done:
+            job = in_flight.pop(future)
+            try:
+                finish(future.result())
+            except concurrent.futures.process.BrokenProcessPool:
+                broken.append(job)
+        executor.shutdown()
+        executor = concurrent.futures.ProcessPoolExecutor(workers)
+        for job in broken:
+            try:
+                finish(executor.submit(run_job, job).result())
+            except concurrent.futures.process.BrokenProcessPool as error:
+                finish(crashed_job_result(job, error))
+                executor.shutdown()
+                executor = concurrent.futures.ProcessPoolExecutor(workers)
+    try:
+        for job, problem in read_jobs(input_stream):
+            if problem is not None:
+                write_result(problem, output_stream)
+                continue
+            # Wait for room before reading any further
+            while len(in_flight) >= max_in_flight:
+                collect(concurrent.futures.FIRST_COMPLETED)
+            in_flight[executor.submit(run_job, job)] = job
+            jobs_run += 1
+        while in_flight:
+            collect(concurrent.futures.FIRST_COMPLETED)
+    finally:
+        executor.shutdown()
+    return jobs_run
+
+# Run a batch from the command line, reading jobs from a file or standard in
+# and writing results to standard out, and optionally metrics to a file.
+def run_batch_from_cli(arguments):
+    usage = "Usage: ./magic_number_batch.py [--workers N] " + \
+            "[--metrics metrics.prom] [jobs.jsonl]"
+    workers = 0
+    metrics_path = None
+    arguments = arguments[1:]
+    while len(arguments) >= 2 and arguments[0] in ("--workers", "--metrics"):
+        if arguments[0] == "--workers":
+            if not arguments[1].isdigit():
+                print(usage)
+                sys.exit(1)
+            workers = int(arguments[1])
+        else:
+            metrics_path = arguments[1]
+        arguments = arguments[2:]
+    if len(arguments) > 1:
+        print(usage)
+        sys.exit(1)
+    metrics = MNM.MNMetrics() if metrics_path is not None else None
+    if len(arguments) == 1:
+        with open(arguments[0]) as input_stream:
+            run_batch(input_stream, sys.stdout, workers, metrics = metrics)
+    else:
+        run_batch(sys.stdin, sys.stdout, workers, metrics = metrics)
+    if metrics is not None:
+        metrics.write_prometheus_file(metrics_path)
+
+if __name__ == "__main__":
+    run_batch_from_cli(sys.argv)
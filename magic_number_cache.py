@@ -0,0 +1,200 @@
+#!/bin/python3
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+import magic_number_executer as MNE
+import magic_number_optimizer as MNO
+
+# Memoization of MN program results. A MN program is a pure function of its
+# input lines, so a run with scripted input is fully described by its output
+# and final stack. A cache passed to `run_interpreter_from_python` is consulted
+# before the program is parsed, and filled in after it runs. Along with each
+# result, the statistics of the run which cannot be told from the output are
+# kept: the "instructions" it executed and the "peak_stack_depth" it reached.
+
+# The most uses of results on disk remembered before their times are written.
+# Recording when a result was last used is a write, so uses are written in
+# batches rather than on every read.
+MAX_PENDING_USES = 256
+
+# Compute the key under which the result of running `program_source` on
+# `input_lines` is stored.
+def result_cache_key(program_source, input_lines):
+    program_hash = hashlib.sha256(program_source.encode("utf-8")).hexdigest()
+    input_hash = hashlib.sha256(json.dumps(list(input_lines)) \
+                                .encode("utf-8")).hexdigest()
+    return program_hash + ":" + input_hash
+
+# A least-recently-used cache of (output, final stack, statistics) results. The
+# in-memory cache holds at most `max_entries` results totalling roughly
+# `max_bytes`. If a `path` is given, results are also kept in a SQLite database
+# at that path, which survives the process and holds at most `max_disk_entries`
+# results. Call `close` to write when the last results on disk were used.
+class MNResultCache:
+    def __init__(self, max_entries = 1024, max_bytes = 64 * 1024 * 1024, \
+                 path = None, max_disk_entries = 65536):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_disk_entries = max_disk_entries
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.database = None
+        # The times results on disk were last used, by key, not yet written
+        self.pending_uses = {}
+        if path is not None:
+            self.database = sqlite3.connect(path)
+            self.database.execute("CREATE TABLE IF NOT EXISTS results " \
+                                  "(key TEXT PRIMARY KEY, output TEXT, " \
+                                  "stack TEXT, last_used REAL, " \
+                                  "statistics TEXT)")
+            # Databases written before statistics were kept lack their column
+            columns = [row[1] for row in self.database.execute( \
+                       "PRAGMA table_info(results)")]
+            if "statistics" not in columns:
+                self.database.execute("ALTER TABLE results ADD COLUMN " \
+                                      "statistics TEXT")
+            self.disk_entries = self.database.execute( \
+                "SELECT COUNT(*) FROM results").fetchone()[0]
+
+    # Return the cached (output, final stack, statistics) for a run, or None.
+    def get(self, program_source, input_lines):
+        key = result_cache_key(program_source, input_lines)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if self.database is not None:
+            row = self.database.execute("SELECT output, stack, statistics " \
+                                        "FROM results WHERE key = ?", \
+                                        (key,)).fetchone()
+            if row is not None:
+                self.pending_uses[key] = time.time()
+                if len(self.pending_uses) >= MAX_PENDING_USES:
+                    self.write_pending_uses()
+                    self.database.commit()
+                result = (row[0], json.loads(row[1]), \
+                          json.loads(row[2]) if row[2] is not None else {})
+                self.remember(key, result)
+                self.hits += 1
+                return result
+        self.misses += 1
+        return None
+
+    # Store the output, final stack and statistics of a run.
+    def put(self, program_source, input_lines, output, final_stack, \
+            statistics = None):
+        key = result_cache_key(program_source, input_lines)
+        result = (output, list(final_stack), dict(statistics or {}))
+        self.remember(key, result)
+        if self.database is not None:
+            if self.database.execute("SELECT 1 FROM results WHERE key = ?", \
+                                     (key,)).fetchone() is None:
+                self.disk_entries += 1
+            self.pending_uses.pop(key, None)
+            self.database.execute("INSERT OR REPLACE INTO results (key, " \
+                                  "output, stack, last_used, statistics) " \
+                                  "VALUES (?, ?, ?, ?, ?)", (key, output, \
+                                  json.dumps(result[1]), time.time(), \
+                                  json.dumps(result[2])))
+            # Evict the least recently used results from disk, knowing when
+            # each was last used
+            self.write_pending_uses()
+            if self.disk_entries > self.max_disk_entries:
+                excess = self.disk_entries - self.max_disk_entries
+                self.database.execute("DELETE FROM results WHERE key IN " \
+                                      "(SELECT key FROM results ORDER BY " \
+                                      "last_used LIMIT ?)", (excess,))
+                self.disk_entries -= excess
+            self.database.commit()
+
+    # Write the times results on disk were last used, without committing them.
+    def write_pending_uses(self):
+        if self.pending_uses:
+            self.database.executemany("UPDATE results SET last_used = ? " \
+                                      "WHERE key = ?", \
+                                      [(last_used, key) for key, last_used \
+                                       in self.pending_uses.items()])
+            self.pending_uses.clear()
+
+    # Add a result to the in-memory cache, evicting the least recently used
+    # results until it is within its bounds again.
+    def remember(self, key, result):
+        if key in self.entries:
+            self.size -= entry_size(self.entries.pop(key))
+        self.entries[key] = result
+        self.size += entry_size(result)
+        while len(self.entries) > self.max_entries or \
+              self.size > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last = False)
+            self.size -= entry_size(evicted)
+
+    # Forget every cached result, including those on disk.
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+        self.pending_uses.clear()
+        if self.database is not None:
+            self.database.execute("DELETE FROM results")
+            self.database.commit()
+            self.disk_entries = 0
+
+    def close(self):
+        if self.database is not None:
+            self.write_pending_uses()
+            self.database.commit()
+            self.database.close()
+            self.database = None
+
+# Approximate the number of bytes a cached result occupies.
+def entry_size(result):
+    output, final_stack, _ = result
+    return len(output) + 8 * len(final_stack)
+
+# A least-recently-used cache of compiled programs, so that long-lived
+# processes running the same programs repeatedly parse each of them only once.
+# Programs are looked up by source or by file path; a file is compiled again if
+# it has changed on disk since it was cached. Programs may be optimized as they
+# are compiled (see magic_number_optimizer.py), and are cached separately if so.
+class MNProgramCache:
+    def __init__(self, max_entries = 256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # Return the compiled statements and labels of MN source code, which may
+    # still contain comments.
+    def get_source(self, source, optimize = False):
+        key = ("source", hashlib.sha256(source.encode("utf-8")).hexdigest(), \
+               optimize)
+        return self.lookup(key, lambda: MNE.strip_MN_source(source), optimize)
+
+    # Return the compiled statements and labels of a MN file.
+    def get_path(self, path, optimize = False):
+        path = os.path.abspath(path)
+        status = os.stat(path)
+        key = ("path", path, status.st_mtime_ns, status.st_size, optimize)
+        return self.lookup(key, lambda: MNE.load_MN_file(path), optimize)
+
+    def lookup(self, key, load_program_source, optimize = False):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        if optimize:
+            compiled_program = \
+                MNO.compile_optimized_MN_program(load_program_source())
+        else:
+            compiled_program = MNE.compile_MN_program(load_program_source())
+        self.entries[key] = compiled_program
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last = False)
+        return compiled_program
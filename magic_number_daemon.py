@@ -0,0 +1,221 @@
+#!/bin/python3
+
+import errno
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import time
+
+import magic_number_executer as MNE
+import magic_number_cache as MNC
+import magic_number_metrics as MNM
+
+# A long-lived Magic Number server. Starting Python and importing the
+# interpreter costs far more than running a typical MN program, so the server
+# listens on a Unix socket and runs programs on request, keeping compiled
+# programs warm between requests.
+#
+# The protocol is JSON lines. Each request is an object on its own line naming
+# a program by "path" or giving its "source", with optional "input" lines:
+#   {"path": "samples/adder.magic", "input": ["3", "4"]}
+# The response is an object on its own line with the program's "output", its
+# final "stack", the counters of `get_run_statistics`, the memory estimates of
+# `get_memory_statistics` and the "elapsed" seconds, or an "error" describing
+# why the request failed. The response's "status" says whether the program
+# "completed" or was stopped early. Requests may limit a run with "options":
+#   {"source": "...", "options": {"max_instructions": 100000,
+#                                 "max_seconds": 1.5, "detect_loops": true,
+#                                 "max_stack": 4096, "stack_policy": "stop",
+#                                 "optimize": true}}
+# With "optimize", the program is run as optimized by magic_number_optimizer.py,
+# which executes fewer statements to the same output and final stack.
+# A connection may carry any number of requests. The request
+# {"command": "stats"} returns counters describing the server, and
+# {"command": "shutdown"} stops it. Metrics covering every run can also be
+# served over HTTP in the Prometheus text format. Clients connect through
+# magic_number_daemon_client.py, which starts without loading the interpreter.
+
+# Exceptions that end a single run without bringing down the server. The
+# interpreter's own exceptions derive from BaseException, so they are listed.
+RUN_ERRORS = (Exception, MNE.OutOfScriptedInputException, \
+              MNE.InvalidMNInstructionException, \
+              MNE.MisinterpretedInstructionException, \
+              MNE.StackUnderflowException)
+
+# The options a request may give, and the arguments of
+# `run_compiled_MN_program` they set.
+RUN_OPTIONS = {"max_instructions" : "max_instructions", \
+               "max_seconds" : "max_seconds", \
+               "detect_loops" : "detect_loops", \
+               "max_stack" : "max_stack", \
+               "stack_policy" : "stack_policy"}
+
+# The options a request may give which change how its program is compiled.
+COMPILE_OPTIONS = ("optimize",)
+
+# Run the program named by a request object, compiling it through the given
+# program cache, and return the response object describing the result.
+def run_program_request(request, programs):
+    if "path" not in request and "source" not in request:
+        return {"error" : "request has neither \"path\" nor \"source\""}
+    options = request.get("options", {})
+    if not isinstance(options, dict):
+        return {"error" : "\"options\" must be a JSON object"}
+    for option in options:
+        if option not in RUN_OPTIONS and option not in COMPILE_OPTIONS:
+            return {"error" : "unknown option \"{}\"".format(option)}
+    run_arguments = {RUN_OPTIONS[option] : value \
+                     for option, value in options.items() \
+                     if option in RUN_OPTIONS}
+    optimize = bool(options.get("optimize", False))
+    input_lines = request.get("input", [])
+    if not isinstance(input_lines, list) or \
+       not all(isinstance(line, str) for line in input_lines):
+        return {"error" : "\"input\" must be a JSON array of strings"}
+    start = time.perf_counter()
+    try:
+        if "path" in request:
+            program_statements, program_labels = \
+                programs.get_path(request["path"], optimize)
+        else:
+            program_statements, program_labels = \
+                programs.get_source(request["source"], optimize)
+        output = MNE.run_compiled_MN_program(program_statements, \
+                                             program_labels, \
+                                             list(input_lines), \
+                                             **run_arguments)
+    except RUN_ERRORS as error:
+        message = getattr(error, "message", str(error))
+        return {"error" : "{}: {}".format(type(error).__name__, message)}
+    response = {"output" : output, "stack" : MNE.stack}
+    response.update(MNE.get_run_statistics())
+    response.update(MNE.get_memory_statistics())
+    response["elapsed"] = time.perf_counter() - start
+    return response
+
+# Handles one client connection, answering each request line in turn.
+class MNRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("request must be a JSON object")
+                response = self.server.handle_request_object(request)
+            except ValueError as error:
+                response = {"error" : "bad request: {}".format(error)}
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            self.wfile.flush()
+            if self.server.shutdown_requested:
+                break
+
+# Remove a socket left behind at `socket_path` by a server which did not exit
+# cleanly. Raise FileExistsError if something else is there: a file which is not
+# a socket, or the socket of a server which is still running.
+def remove_stale_socket(socket_path):
+    try:
+        mode = os.stat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(errno.EEXIST, "Not a socket", socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except ConnectionRefusedError:
+            os.unlink(socket_path)
+            return
+    raise FileExistsError(errno.EEXIST, "A server is already listening on " \
+                          "this socket", socket_path)
+
+# The server. Each connection is served by a thread of its own, so an idle
+# client does not hold up the others, but programs are run one at a time,
+# since the interpreter's state is global.
+class MNDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    # Connections still open when the server stops do not keep it running
+    daemon_threads = True
+
+    def __init__(self, socket_path, max_programs = 256):
+        remove_stale_socket(socket_path)
+        self.socket_path = socket_path
+        self.interpreter_lock = threading.Lock()
+        self.programs = MNC.MNProgramCache(max_programs)
+        self.requests_served = 0
+        self.started = time.time()
+        self.shutdown_requested = False
+        self.metrics = MNM.MNMetrics()
+        super().__init__(socket_path, MNRequestHandler)
+
+    def handle_request_object(self, request):
+        command = request.get("command", "run")
+        if command == "run":
+            with self.interpreter_lock:
+                return self.run_program(request)
+        if command == "stats":
+            with self.interpreter_lock:
+                return self.stats()
+        if command == "shutdown":
+            # shutdown() waits for the serving loop, which is running this
+            # request, so it must be called from another thread
+            self.shutdown_requested = True
+            threading.Thread(target = self.shutdown).start()
+            return {"status" : "shutting down"}
+        return {"error" : "unknown command \"{}\"".format(command)}
+
+    # Run the program named by a request and describe the result.
+    def run_program(self, request):
+        self.requests_served += 1
+        response = run_program_request(request, self.programs)
+        self.metrics.record(response)
+        return response
+
+    def stats(self):
+        stats = {"requests" : self.requests_served, \
+                 "programs_cached" : len(self.programs.entries), \
+                 "program_cache_hits" : self.programs.hits, \
+                 "program_cache_misses" : self.programs.misses, \
+                 "uptime" : time.time() - self.started}
+        stats["metrics"] = self.metrics.as_dict()
+        return stats
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+# Serve requests on a Unix socket until asked to shut down, and metrics on a
+# local HTTP port if one is given.
+def serve(socket_path, max_programs = 256, metrics_port = None):
+    with MNDaemon(socket_path, max_programs) as daemon:
+        metrics_server = None
+        if metrics_port is not None:
+            metrics_server = MNM.serve_metrics(daemon.metrics, metrics_port)
+        try:
+            daemon.serve_forever()
+        finally:
+            if metrics_server is not None:
+                metrics_server.shutdown()
+                metrics_server.server_close()
+
+# Run the server from the command line. Programs are run on the server with the
+# client of magic_number_daemon_client.py.
+def run_daemon_from_cli(arguments):
+    usage = "Usage: ./magic_number_daemon.py serve socket_path [metrics_port]"
+    if len(arguments) == 3 and arguments[1] == "serve":
+        serve(arguments[2])
+        return
+    if len(arguments) == 4 and arguments[1] == "serve" and \
+       arguments[3].isdigit():
+        serve(arguments[2], metrics_port = int(arguments[3]))
+        return
+    print(usage)
+    sys.exit(1)
+
+if __name__ == "__main__":
+    run_daemon_from_cli(sys.argv)
@@ -0,0 +1,84 @@
+#!/bin/python3
+
+import json
+import os
+import socket
+import sys
+
+# A thin client for the Magic Number daemon of magic_number_daemon.py. The
+# daemon exists to save the cost of starting the interpreter, so this module
+# imports nothing beyond what it needs to talk to the socket, and starts much
+# faster than the interpreter itself.
+
+# A connection to a running server. One connection can be used for any number
+# of requests.
+class MNDaemonClient:
+    def __init__(self, socket_path):
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.connect(socket_path)
+        self.reader = self.connection.makefile("r", encoding = "utf-8")
+
+    # Send a request object and return the response object.
+    def request(self, request):
+        self.connection.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Magic Number daemon closed the connection")
+        return json.loads(line)
+
+    # Run a program, named by path or given as source, on lines of input.
+    def run(self, path = None, source = None, input_lines = []):
+        request = {"input" : list(input_lines)}
+        if path is not None:
+            request["path"] = os.path.abspath(path)
+        else:
+            request["source"] = source
+        return self.request(request)
+
+    def close(self):
+        self.reader.close()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+# Read the lines of input for a program from a stream, such as the standard
+# input of a shell pipeline. A terminal gives no input, rather than waiting for
+# the user to end it.
+def read_input_lines(stream):
+    if stream.isatty():
+        return []
+    return stream.read().splitlines()
+
+# Run the client from the command line. The client runs one program and prints
+# its output, taking lines of input from standard input.
+def run_client_from_cli(arguments):
+    usage = "Usage: ./magic_number_daemon_client.py run socket_path " + \
+            "program_file.magic < input_lines\n" + \
+            "       ./magic_number_daemon_client.py stats|shutdown " + \
+            "socket_path"
+    if len(arguments) < 3:
+        print(usage)
+        sys.exit(1)
+    command, socket_path = arguments[1], arguments[2]
+    if command == "run" and len(arguments) == 4:
+        input_lines = read_input_lines(sys.stdin)
+        with MNDaemonClient(socket_path) as client:
+            response = client.run(arguments[3], input_lines = input_lines)
+        if "error" in response:
+            print(response["error"], file = sys.stderr)
+            sys.exit(1)
+        print(response["output"], end = "")
+        return
+    if command in ("stats", "shutdown") and len(arguments) == 3:
+        with MNDaemonClient(socket_path) as client:
+            print(json.dumps(client.request({"command" : command})))
+        return
+    print(usage)
+    sys.exit(1)
+
+if __name__ == "__main__":
+    run_client_from_cli(sys.argv)
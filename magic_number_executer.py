@@ -1,8 +1,10 @@
 #!/bin/python3
 
 import re
-import copy
+import codecs
 import sys
+import time
+from collections import deque
 
 # The idea is for every non-negative integer to be a valid program, even if the
 # program makes no sense. Thus the MN runtime avoids erroring even in cases such
@@ -52,10 +54,104 @@ def isTrue(floating_point):
 debug = False
 
 # If scripting mode is enabled via an argument to `run_interpreter_from_python`,
-# then `input()` takes the next element from scripted_input instead of from
-# standard input
+# then input is taken from scripted_input instead of from standard input
 scripting = False
 
+# The input provider which supplies the lines read by the MN program. See the
+# input provider classes below. It is chosen by `configure_interpreter`.
+input_provider = None
+
+# The number of statements the program has stepped through, counting no-ops
+# such as labels. This is always maintained, debug mode or not.
+instructions_executed = 0
+
+# Counters describing the current run, which are also always maintained: the
+# number of exceptions swallowed by 019 "division" and 022 "remainder", the
+# number of binary operations which found too few values on the stack, the
+# number of lines of input read and the number of bytes of output written, in
+# UTF-8.
+swallowed_errors = 0
+underflows = 0
+input_reads = 0
+output_bytes = 0
+
+# The ways a run can end. A run completes when it steps past its last statement.
+# It can also be stopped early because it was found to be looping forever,
+# because it used up its instruction or time budget, or because its stack grew
+# past its limit.
+COMPLETED = "completed"
+INFINITE_LOOP = "infinite_loop"
+INSTRUCTION_BUDGET_EXHAUSTED = "instruction_budget_exhausted"
+TIME_BUDGET_EXHAUSTED = "time_budget_exhausted"
+STACK_LIMIT_EXCEEDED = "stack_limit_exceeded"
+
+# How the last run ended.
+termination_status = COMPLETED
+
+# The greatest number of statements a run may step through, or None for no
+# limit.
+instruction_budget = None
+
+# The greatest number of seconds a run may take, or None for no limit. The clock
+# is only consulted every TIME_CHECK_INTERVAL statements.
+time_budget = None
+TIME_CHECK_INTERVAL = 1024
+
+# The time at which the current run's time budget runs out.
+deadline = None
+
+# If loop detection is enabled, the state of the program (instruction pointer
+# and stack) is recorded at backward branches. Without input or output in
+# between, a program which reaches the same state twice will do so forever, so
+# it is stopped. Only every LOOP_DETECTION_SAMPLE_INTERVAL-th backward branch is
+# recorded, and at most LOOP_DETECTION_TABLE_SIZE states are remembered; the
+# table is emptied when it fills up and whenever input or output happens.
+loop_detection = False
+LOOP_DETECTION_SAMPLE_INTERVAL = 16
+LOOP_DETECTION_TABLE_SIZE = 4096
+
+# The greatest number of values the stack may hold, or None for no limit, and
+# what happens when a push would exceed it: the program is stopped, or the value
+# at the bottom of the stack is dropped to make room.
+stack_limit = None
+STOP_AT_STACK_LIMIT = "stop"
+DROP_OLDEST_AT_STACK_LIMIT = "drop_oldest"
+STACK_LIMIT_POLICIES = (STOP_AT_STACK_LIMIT, DROP_OLDEST_AT_STACK_LIMIT)
+stack_limit_policy = STOP_AT_STACK_LIMIT
+
+# The greatest number of values the stack has held during the current run, and
+# the number of values dropped from the bottom of the stack to stay within its
+# limit.
+peak_stack_depth = 0
+stack_values_dropped = 0
+
+# The approximate number of bytes taken by each value on the stack: the float
+# and the stack's reference to it.
+STACK_VALUE_BYTES = sys.getsizeof(0.0) + \
+                    sys.getsizeof([None]) - sys.getsizeof([])
+
+# Loops which can be run in bulk, keyed by the statement number of the label
+# they start at. See magic_number_loops.py. An accelerator is called with the
+# number of statements the run may still execute and returns how many it
+# executed on the program's behalf and where execution continues. Loops are
+# not accelerated in debug mode, with loop detection or with a stack limit,
+# which all need to see every statement.
+loop_accelerators = {}
+
+# The number of statements of the current run executed by loop accelerators.
+# They are included in `instructions_executed`.
+accelerated_instructions = 0
+
+# The states recorded for loop detection.
+visited_states = set()
+
+# The number of backward branches since a state was last recorded.
+branches_since_sample = 0
+
+# Whether the program has read input or written output since the last backward
+# branch. This is only used if `loop_detection` is true.
+io_performed = False
+
 # A list of every instruction executed, in the order in which they were executed.
 # This list is used only if `debug` is true.
 instruction_trace = []
@@ -68,6 +164,20 @@ stack_history = []
 # This is only used if `debug` is true.
 printed_output = ""
 
+# If capturing mode is enabled via `configure_interpreter`, text the MN program
+# sends to standard output is collected in captured_output instead of being
+# printed, so that it can be returned to a caller or replayed later.
+capturing = False
+
+# If teeing is enabled, text the MN program sends to standard output is printed
+# as usual and also collected in captured_output, so that it can be remembered
+# once the run is over.
+teeing = False
+
+# A list of the pieces of text sent to standard output, in order. This list is
+# only used if `capturing` or `teeing` is true.
+captured_output = []
+
 # A list containing lines to be used as input in place of standard in. This list
 # is only used if `scripting` is true. If an attempt is made to take input
 # from the list when it is empty that is an error for the MN program. This is
@@ -78,7 +188,7 @@ scripted_input = []
 def record_debugging_information(instruction):
     if debug:
         instruction_trace.append(instruction)
-        stack_history.append(copy.deepcopy(stack))
+        stack_history.append(list(stack))
 
 # Append a copy of text being sent to standard output if debugging is enabled.
 def record_standard_output(recordand):
@@ -86,20 +196,147 @@ def record_standard_output(recordand):
     if debug:
         printed_output += recordand
 
-# Get the next line of input. If `scripting` is true, take the line from the
-# preset list of input, otherwise, read a line from standard in. If preset input
-# is needed but no more is available, that is an error for the MN program.
+# Send text to standard output on behalf of the MN program, or collect it if
+# output is being captured.
+def write_standard_output(writand):
+    global io_performed
+    global output_bytes
+    io_performed = True
+    # 006 "print char" can print lone surrogates, which are counted as the
+    # bytes they would take if written anyway
+    output_bytes += len(writand.encode("utf-8", "surrogatepass"))
+    record_standard_output(writand)
+    if capturing or teeing:
+        captured_output.append(writand)
+    if not capturing:
+        print(writand, end="")
+
+# Return all text the MN program has sent to standard output while capturing.
+def get_captured_output():
+    return "".join(captured_output)
+
+# Return the counters describing the last run, with how it ended.
+def get_run_statistics():
+    return {"status" : termination_status, \
+            "instructions" : instructions_executed, \
+            "swallowed_errors" : swallowed_errors, \
+            "underflows" : underflows, \
+            "input_reads" : input_reads, \
+            "output_bytes" : output_bytes}
+
+# Get the next line of input from the current input provider. If `scripting`
+# is true, this is the next line of the preset list of input, otherwise it is
+# the next line of standard in. If preset input is needed but no more is
+# available, that is an error for the MN program.
 def get_next_input_line():
-    # If scripting, retrieve next preset input and remove it from the list
-    if scripting:
+    global io_performed
+    global input_reads
+    io_performed = True
+    input_reads += 1
+    return input_provider.next_line()
+
+# Input providers supply the lines of input read by a MN program. A provider is
+# any object with a `next_line()` method returning the next line without its
+# line terminator, raising OutOfScriptedInputException or EOFError when there
+# is no more input.
+
+# Provides the lines of a list of preset input, in order. The list is read by
+# index and never modified.
+class ScriptedInputProvider:
+    def __init__(self, lines):
+        self.lines = lines
+        self.position = 0
+
+    def next_line(self):
         # Ensure there is more input to read, otherwise fail
-        if len(scripted_input) == 0:
+        if self.position >= len(self.lines):
             raise OutOfScriptedInputException()
-        input_line = scripted_input.pop(0)
-    # Just read and return a line from standard input
-    else:
-        input_line = input()
-    return input_line
+        input_line = self.lines[self.position]
+        self.position += 1
+        return input_line
+
+# Provides the lines produced by an iterator, such as an open file. Line
+# terminators are removed, as `input()` would.
+class IteratorInputProvider:
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+
+    def next_line(self):
+        try:
+            input_line = next(self.iterator)
+        except StopIteration:
+            raise EOFError()
+        return strip_line_terminator(input_line)
+
+# Provides the lines of a text stream, standard in by default. Rather than
+# reading a line at a time, the stream is read in large blocks which are split
+# into lines here. Reads take whatever input is available up to the block size,
+# so interactive input is still answered a line at a time.
+class StreamInputProvider:
+    BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, stream = None, block_size = BLOCK_SIZE):
+        self.stream = sys.stdin if stream is None else stream
+        self.block_size = block_size
+        self.lines = deque()
+        self.partial_line = ""
+        self.at_end = False
+        # Prefer reading raw bytes from the stream's buffer, which returns as
+        # soon as some input is available
+        buffer = getattr(self.stream, "buffer", None)
+        self.read_bytes = getattr(buffer, "read1", None)
+        if self.read_bytes is not None:
+            encoding = getattr(self.stream, "encoding", None) or "utf-8"
+            errors = getattr(self.stream, "errors", None) or "strict"
+            self.decoder = codecs.getincrementaldecoder(encoding)(errors)
+
+    def next_line(self):
+        while not self.lines:
+            if self.at_end:
+                # The last line of input may lack a terminator
+                if self.partial_line:
+                    input_line = self.partial_line
+                    self.partial_line = ""
+                    return strip_line_terminator(input_line)
+                raise EOFError()
+            self.read_block()
+        return strip_line_terminator(self.lines.popleft())
+
+    # Read the next block of the stream and split it into complete lines.
+    def read_block(self):
+        # Like `input()`, make sure any prompt has been shown before blocking
+        sys.stdout.flush()
+        if self.read_bytes is not None:
+            data = self.read_bytes(self.block_size)
+            text = self.decoder.decode(data, not data)
+        else:
+            text = self.stream.read(self.block_size)
+            data = text
+        if not data:
+            self.at_end = True
+        pieces = (self.partial_line + text).split("\n")
+        self.partial_line = pieces.pop()
+        self.lines.extend(pieces)
+
+# The provider reading standard in. It is shared by every run which reads
+# standard in so that input buffered by one run is not lost to the next.
+standard_input_provider = None
+
+# Return the provider for standard in, replacing it if `sys.stdin` has changed.
+def get_standard_input_provider():
+    global standard_input_provider
+    if standard_input_provider is None or \
+       standard_input_provider.stream is not sys.stdin:
+        standard_input_provider = StreamInputProvider(sys.stdin)
+    return standard_input_provider
+
+# Remove a trailing "\n" or "\r\n" from a line of input.
+def strip_line_terminator(line):
+    if line.endswith("\n"):
+        line = line[:-1]
+    if line.endswith("\r"):
+        line = line[:-1]
+    return line
 
 # Reset the state of the interpreter.
 def reset_interpreter():
@@ -109,16 +346,62 @@ def reset_interpreter():
     global stack_history
     global printed_output
     global debug
-    global scripted
+    global scripting
     global scripted_input
+    global input_provider
+    global capturing
+    global teeing
+    global captured_output
+    global instructions_executed
+    global swallowed_errors
+    global underflows
+    global input_reads
+    global output_bytes
+    global termination_status
+    global instruction_budget
+    global time_budget
+    global deadline
+    global loop_detection
+    global visited_states
+    global branches_since_sample
+    global io_performed
+    global stack_limit
+    global stack_limit_policy
+    global peak_stack_depth
+    global stack_values_dropped
+    global loop_accelerators
+    global accelerated_instructions
     stack = []
     labels = {}
     instruction_trace = []
     debug = False
     stack_history = []
     printed_output = ""
-    scripted = False
+    scripting = False
     scripted_input = []
+    input_provider = None
+    capturing = False
+    teeing = False
+    captured_output = []
+    instructions_executed = 0
+    swallowed_errors = 0
+    underflows = 0
+    input_reads = 0
+    output_bytes = 0
+    termination_status = COMPLETED
+    instruction_budget = None
+    time_budget = None
+    deadline = None
+    loop_detection = False
+    visited_states = set()
+    branches_since_sample = 0
+    io_performed = False
+    stack_limit = None
+    stack_limit_policy = STOP_AT_STACK_LIMIT
+    peak_stack_depth = 0
+    stack_values_dropped = 0
+    loop_accelerators = {}
+    accelerated_instructions = 0
         
 # Load a MN file. Simply read the entire file and remove non-digits. No check
 # for validity is performed. Exceptions are permitted to propagate up.
@@ -132,10 +415,15 @@ def load_MN_file(loadand):
     # Close the file
     source_file.close()
     # Strip all non-decimal-digit characters
-    results = "".join([char for char in contents if char in "0123456789"])
+    results = strip_MN_source(contents)
     # Return the remaining contents
     return results
 
+# Remove every character that is not a decimal digit from MN source code,
+# leaving the program itself.
+def strip_MN_source(contents):
+    return re.sub("[^0-9]", "", contents)
+
 # Parse the contents from a MN file. This is simply a matter of splitting the
 # source code into individual statements. This function does not verify that
 # the program_source is valid. However, it ensures that all the instructions in
@@ -177,38 +465,136 @@ def declare_MN_labels(program_statements):
             
 # Execute a MN program. Iterate through the list of program statements executing
 # each sequentially, changing the instruction pointer appropriately as the
-# result of branches.
-def execute_MN_program(program_statements):
-    # Track the index of the current statement, ie the instruction pointer
-    instruction_pointer = 0
-    # While the end of the program has not been reached
-    while instruction_pointer < len(program_statements):
-        # Get the current instruction and its opcode
-        instruction = program_statements[instruction_pointer]
-        opcode = instruction[:3]
-        # If the opcode is not 007 "create label" or 008 "conditional branch"
-        if opcode != "007" and opcode != "008":
-            # Find and execute the function that handles this instruction
-            if opcode in OPCODES:
-                implementing_function = FUNCTIONS[opcode]
-                implementing_function(instruction)
-            # Invalid opcodes are treated as no-ops
-            else:
-                pass
-            # Even no-ops are recorded for debugging purposes
-            record_debugging_information(instruction)
-            instruction_pointer += 1
-        # Handle the special case of a conditional branch
-        elif opcode == "008":
-            new_instruction_pointer = conditional_branch(instruction)
-            record_debugging_information(instruction)
-            if new_instruction_pointer != -1:
-                instruction_pointer = new_instruction_pointer
+# result of branches. Execution starts at statement `instruction_pointer` and
+# stops early, without executing it, at the first statement whose opcode is in
+# `stop_opcodes`. Execution also stops if a budget runs out, an infinite loop is
+# detected or the stack limit is exceeded, in which case `termination_status`
+# says why. Return the instruction pointer where execution stopped.
+def execute_MN_program(program_statements, instruction_pointer = 0, \
+                       stop_opcodes = ()):
+    global instructions_executed
+    global termination_status
+    global accelerated_instructions
+    global stack
+    # Dropping the bottom of the stack at its limit is cheap from a deque, so
+    # the stack is one for the run and is handed back as a list
+    dropping = stack_limit is not None and \
+               stack_limit_policy == DROP_OLDEST_AT_STACK_LIMIT
+    if dropping:
+        stack = deque(stack)
+    # Count statements locally and add them to the total on the way out, even
+    # if the MN program is stopped by an exception
+    executed = 0
+    # The local count at which budgets must next be checked
+    check_budgets_at = next_budget_check(executed)
+    accelerating = bool(loop_accelerators) and not debug and \
+                   not loop_detection and stack_limit is None
+    try:
+        # While the end of the program has not been reached
+        while instruction_pointer < len(program_statements):
+            # Get the current instruction and its opcode
+            instruction = program_statements[instruction_pointer]
+            opcode = instruction[:3]
+            # Leave the instruction pointer on a requested stopping point
+            if opcode in stop_opcodes:
+                break
+            # Run a recognized loop in bulk, as far as the budgets allow
+            if accelerating and instruction_pointer in loop_accelerators:
+                accelerated, new_instruction_pointer = \
+                    loop_accelerators[instruction_pointer]( \
+                        check_budgets_at - executed)
+                if accelerated:
+                    executed += accelerated
+                    accelerated_instructions += accelerated
+                    instruction_pointer = new_instruction_pointer
+                    continue
+            # Stop if a budget has run out
+            if executed >= check_budgets_at:
+                termination_status = exhausted_budget(executed)
+                if termination_status != COMPLETED:
+                    break
+                check_budgets_at = next_budget_check(executed)
+            executed += 1
+            # If the opcode is not 007 "create label" or 008 "conditional
+            # branch"
+            if opcode != "007" and opcode != "008":
+                # Find and execute the function that handles this instruction
+                if opcode in OPCODES:
+                    implementing_function = FUNCTIONS[opcode]
+                    implementing_function(instruction)
+                # Invalid opcodes are treated as no-ops
+                else:
+                    pass
+                # Even no-ops are recorded for debugging purposes
+                record_debugging_information(instruction)
+                instruction_pointer += 1
+            # Handle the special case of a conditional branch
+            elif opcode == "008":
+                new_instruction_pointer = conditional_branch(instruction)
+                record_debugging_information(instruction)
+                if new_instruction_pointer != -1:
+                    # Look for a repeated state on backward branches
+                    if loop_detection and \
+                       new_instruction_pointer <= instruction_pointer and \
+                       state_repeated(new_instruction_pointer):
+                        instruction_pointer = new_instruction_pointer
+                        termination_status = INFINITE_LOOP
+                        break
+                    instruction_pointer = new_instruction_pointer
+                else:
+                    instruction_pointer += 1
+            # "create label" is a no-op here; it is done prior to program
+            # execution
             else:
                 instruction_pointer += 1
-        # "create label" is a no-op here; it is done prior to program execution
-        else:
-            instruction_pointer += 1
+    except StackLimitExceededException:
+        termination_status = STACK_LIMIT_EXCEEDED
+    finally:
+        instructions_executed += executed
+        if dropping:
+            stack = list(stack)
+    return instruction_pointer
+
+# Return the number of statements counted locally by `execute_MN_program`
+# after which budgets must next be checked.
+def next_budget_check(executed):
+    check_at = sys.maxsize
+    if instruction_budget is not None:
+        check_at = instruction_budget - instructions_executed
+    if time_budget is not None:
+        check_at = min(check_at, executed + TIME_CHECK_INTERVAL)
+    return check_at
+
+# Return the status a run ends with if one of its budgets has run out after it
+# executed `executed` more statements, or COMPLETED if none has.
+def exhausted_budget(executed):
+    if instruction_budget is not None and \
+       instructions_executed + executed >= instruction_budget:
+        return INSTRUCTION_BUDGET_EXHAUSTED
+    if time_budget is not None and time.monotonic() >= deadline:
+        return TIME_BUDGET_EXHAUSTED
+    return COMPLETED
+
+# Record the state of the program at a backward branch to
+# `instruction_pointer`, and return true if it has been recorded before since
+# the program last performed input or output.
+def state_repeated(instruction_pointer):
+    global io_performed
+    global branches_since_sample
+    if io_performed:
+        visited_states.clear()
+        io_performed = False
+    branches_since_sample += 1
+    if branches_since_sample < LOOP_DETECTION_SAMPLE_INTERVAL:
+        return False
+    branches_since_sample = 0
+    state = (instruction_pointer, tuple(stack))
+    if state in visited_states:
+        return True
+    if len(visited_states) >= LOOP_DETECTION_TABLE_SIZE:
+        visited_states.clear()
+    visited_states.add(state)
+    return False
 
 # Ensure the argument is a float, then push the argument onto the MN program's
 # stack. Otherwise throw an exception.
@@ -220,6 +606,36 @@ def push(pushand):
               "type \"{}\"").format(pushand, type(pushand)))
     # Push the argument onto the stack
     stack.append(pushand)
+    # Only a push reaching a new depth can exceed the limit
+    if len(stack) > peak_stack_depth:
+        enforce_stack_limit()
+
+# Record a new peak depth of the stack, unless it exceeds the stack limit, in
+# which case either stop the program or drop the bottom value of the stack.
+def enforce_stack_limit():
+    global peak_stack_depth
+    global stack_values_dropped
+    if stack_limit is not None and len(stack) > stack_limit:
+        if stack_limit_policy == DROP_OLDEST_AT_STACK_LIMIT:
+            stack.popleft()
+            stack_values_dropped += 1
+            return
+        stack.pop()
+        raise StackLimitExceededException(stack_limit)
+    peak_stack_depth = len(stack)
+
+# Return estimates of the memory used by the current run: its peak stack depth,
+# the bytes its stack held at that depth, and the bytes held by its instruction
+# trace and stack history in debug mode.
+def get_memory_statistics():
+    trace_bytes = sys.getsizeof(instruction_trace) + \
+                  sys.getsizeof(stack_history) + \
+                  sum(sys.getsizeof(entry) for entry in stack_history)
+    return {"peak_stack_depth" : peak_stack_depth, \
+            "stack_values_dropped" : stack_values_dropped, \
+            "peak_stack_bytes" : sys.getsizeof([]) + \
+                                 STACK_VALUE_BYTES * peak_stack_depth, \
+            "trace_bytes" : trace_bytes}
 
 # Pop the top of the MN program's stack. If the stack is empty, throw an
 # exception.
@@ -365,6 +781,9 @@ def read_string(instruction):
             numeric_value = float(ord(string[index]))
             push(numeric_value)
         push(TRUE)
+    # Stopping at the stack limit is not a failed read
+    except StackLimitExceededException:
+        raise
     # If the read failed push false
     except:
         push(FALSE)
@@ -385,8 +804,7 @@ def print_float(instruction):
         return
     floating_point = pop()
     output = str(floating_point)
-    record_standard_output(output)
-    print(output, end="")
+    write_standard_output(output)
 
 # Interpret and execute the printing of a char to standard output. Pop the top
 # of the stack, truncate the float to be a true integer, then test to see if
@@ -410,8 +828,7 @@ def print_char(instruction):
     # Ensure integer is in range of valid Unicode chars, then print char.
     if 0 <= integer and integer <= 1114111:
         char = chr(integer)
-        record_standard_output(char)
-        print(char, end="")
+        write_standard_output(char)
     # Otherwise do nothing
 
 # Interpret and execute the declaration of a label at the current position in
@@ -508,6 +925,7 @@ def logical_not(instruction):
 # underflows, push nothing. The format for all these instructions is simply:
 # ddd, where ddd = the opcode of the instruction
 def binary_operation(instruction, proper_opcode, binary_function):
+    global underflows
     # Ensure the instruction is 3 digits
     if re.match("^\d{3}$", instruction) == None:
         raise InvalidMNInstructionException(instruction)
@@ -517,9 +935,11 @@ def binary_operation(instruction, proper_opcode, binary_function):
         raise MisinterpretedInstructionException(OPCODES[opcode], OPCODES[proper_opcode])
     # Try to pop the stack twice
     if stack_is_empty():
+        underflows += 1
         return
     operand_1 = pop()
     if stack_is_empty():
+        underflows += 1
         return
     operand_2 = pop()
     # Push the result of the binary operation
@@ -592,9 +1012,12 @@ def divide(instruction):
     division_function = lambda a, b: a / b
     try:
         binary_operation(instruction, "019", division_function)
+    # Stopping at the stack limit is not an error of the operation
+    except StackLimitExceededException:
+        raise
     # Swallow exceptions
     except:
-        pass
+        count_swallowed_error()
 
 # Interpret and execute the remainder operator. The highest value on the stack,
 # trucated to an integer, is divided by the second-highest value on the stack,
@@ -605,9 +1028,17 @@ def remainder(instruction):
     remainder_function = lambda a, b: float(int(a) % int(b))
     try:
         binary_operation(instruction, "022", remainder_function)
+    # Stopping at the stack limit is not an error of the operation
+    except StackLimitExceededException:
+        raise
     # Swallow exceptions
     except:
-        pass
+        count_swallowed_error()
+
+# Count an exception swallowed by an instruction.
+def count_swallowed_error():
+    global swallowed_errors
+    swallowed_errors += 1
 
 # Simple custom exception signifying underflow of the MN program's stack
 class StackUnderflowException(BaseException):
@@ -633,6 +1064,14 @@ class MisinterpretedInstructionException(BaseException):
         self.message = "Magic Number Executer misinterpreted {} as {}. " + \
                        "This is an internal error.".format(actual, intended)
 
+# Simple custom exception signifying that a push would take the MN program's
+# stack past its limit. It is caught by `execute_MN_program`, which stops the
+# program.
+class StackLimitExceededException(BaseException):
+    def __init__(self, limit):
+        self.message = "Magic Number program exceeded its stack limit of " + \
+                       "{} values.".format(limit)
+
 # Simple custom exception signifiying that there is no more preset input
 # available for the program to read, but more was requested. This can occur
 # only when `scripting` is true, such as during unit testing.
@@ -666,32 +1105,152 @@ def run_interpreter_from_cli(arguments):
     # Execute the files contents, passing the debug flag
     run_interpreter_from_python(source, is_debugging)
 
-# Run the Magic Number interpreter, taking as input the string source code and
-# the desired value of the debugging flag.
-def run_interpreter_from_python(program_source, is_debugging, \
-                                is_scripting = False, preset_input = []):
+# Reset the interpreter, then set the debugging and testing variables for a new
+# run. Every way of running a MN program goes through this function. Input comes
+# from `provider` if one is given, otherwise from the preset input if scripting
+# and from standard in if not. The run may be limited to `max_instructions`
+# statements and `max_seconds` seconds, and stopped if `detect_loops` is true
+# and it is found to be looping forever. The stack may be limited to
+# `max_stack` values, with `stack_policy` deciding what happens at the limit.
+def configure_interpreter(is_debugging, is_scripting = False, \
+                          preset_input = [], is_capturing = False, \
+                          provider = None, max_instructions = None, \
+                          max_seconds = None, detect_loops = False, \
+                          max_stack = None, \
+                          stack_policy = STOP_AT_STACK_LIMIT):
     global debug
     global scripting
     global scripted_input
+    global input_provider
+    global capturing
+    global instruction_budget
+    global time_budget
+    global deadline
+    global loop_detection
+    global stack_limit
+    global stack_limit_policy
+    if stack_policy not in STACK_LIMIT_POLICIES:
+        raise ValueError("Unknown stack limit policy \"{}\"; expected one " \
+                         "of {}".format(stack_policy, \
+                                        ", ".join(STACK_LIMIT_POLICIES)))
     # Ensure the state of the program is clean
     reset_interpreter()
     # Set debugging and testing variables
     debug = is_debugging
     scripting = is_scripting
     scripted_input = preset_input
+    capturing = is_capturing
+    # Choose where input comes from
+    if provider is not None:
+        input_provider = provider
+    elif scripting:
+        input_provider = ScriptedInputProvider(scripted_input)
+    else:
+        input_provider = get_standard_input_provider()
+    # Set the limits of the run
+    instruction_budget = max_instructions
+    time_budget = max_seconds
+    if time_budget is not None:
+        deadline = time.monotonic() + time_budget
+    loop_detection = detect_loops
+    stack_limit = max_stack
+    stack_limit_policy = stack_policy
+
+# Parse a MN program and declare its labels, returning the statements together
+# with the label table they produced. The label table is detached from the
+# interpreter's global `labels`, so a compiled program can be kept and run any
+# number of times by installing its labels with `install_MN_labels`.
+def compile_MN_program(program_source):
+    global labels
+    labels = {}
+    program_statements = parse_MN_program_source(program_source)
+    declare_MN_labels(program_statements)
+    program_labels = labels
+    labels = {}
+    return program_statements, program_labels
+
+# Make a label table produced by `compile_MN_program` the active one.
+def install_MN_labels(program_labels):
+    global labels
+    labels = dict(program_labels)
+
+# Run a program compiled by `compile_MN_program` on a list of input lines,
+# capturing its output rather than printing it. Return the output; the final
+# stack is left in `stack` as usual.
+def run_compiled_MN_program(program_statements, program_labels, \
+                            preset_input = [], max_instructions = None, \
+                            max_seconds = None, detect_loops = False, \
+                            max_stack = None, \
+                            stack_policy = STOP_AT_STACK_LIMIT):
+    configure_interpreter(False, True, preset_input, True, None, \
+                          max_instructions, max_seconds, detect_loops, \
+                          max_stack, stack_policy)
+    install_MN_labels(program_labels)
+    execute_MN_program(program_statements)
+    return get_captured_output()
+
+# Print the output, instruction trace and stack history recorded in debug mode.
+def print_debugging_information():
+    print("Program execution terminated\n" + "-"*28)
+    print("Standard output:\n\"" + printed_output + "\"")
+    for index in range(len(instruction_trace)):
+        print("{:<16} {}".format(instruction_trace[index], \
+                                 str(stack_history[index])))
+
+# Run the Magic Number interpreter, taking as input the string source code and
+# the desired value of the debugging flag. If a result cache (see
+# magic_number_cache.py) is given, scripted runs are looked up in it before the
+# program is parsed and stored in it afterwards. Debug runs bypass the cache,
+# since they need the full instruction trace, as do runs with a budget or a
+# stack limit, whose results depend on more than their input. An input provider
+# may be given to take input from somewhere other than the preset input or
+# standard in. The remaining arguments limit the run as described for
+# `configure_interpreter`.
+def run_interpreter_from_python(program_source, is_debugging, \
+                                is_scripting = False, preset_input = [], \
+                                result_cache = None, input_provider = None, \
+                                max_instructions = None, max_seconds = None, \
+                                detect_loops = False, max_stack = None, \
+                                stack_policy = STOP_AT_STACK_LIMIT):
+    global stack
+    global teeing
+    global instructions_executed
+    global peak_stack_depth
+    use_cache = result_cache is not None and is_scripting and \
+                not is_debugging and input_provider is None and \
+                max_instructions is None and max_seconds is None and \
+                max_stack is None
+    if use_cache:
+        input_lines = list(preset_input)
+        cached_result = result_cache.get(program_source, input_lines)
+        if cached_result is not None:
+            configure_interpreter(is_debugging, is_scripting, preset_input)
+            output, final_stack, statistics = cached_result
+            stack = list(final_stack)
+            instructions_executed = statistics.get("instructions", 0)
+            peak_stack_depth = statistics.get("peak_stack_depth", 0)
+            write_standard_output(output)
+            return
+    configure_interpreter(is_debugging, is_scripting, preset_input, False, \
+                          input_provider, max_instructions, max_seconds, \
+                          detect_loops, max_stack, stack_policy)
+    # Keep a copy of the output for the cache while still printing it as it
+    # is produced, so that none is lost if the run fails
+    teeing = use_cache
     # Parse the file's contents
     program_statements = parse_MN_program_source(program_source)
     # Declare labels
     declare_MN_labels(program_statements)
     # Execute the program
     execute_MN_program(program_statements)
+    # Remember the result of a run which completed
+    if use_cache and termination_status == COMPLETED:
+        result_cache.put(program_source, input_lines, get_captured_output(), \
+                         stack, {"instructions" : instructions_executed, \
+                                 "peak_stack_depth" : peak_stack_depth})
     # Print debugging information if requested
     if debug:
-        print("Program execution terminated\n" + "-"*28)
-        print("Standard output:\n\"" + printed_output + "\"")
-        for index in range(len(instruction_trace)):
-            print("{:<16} {}".format(instruction_trace[index], \
-                                     str(stack_history[index])))
+        print_debugging_information()
 
 # Only start the interpreter if the program is invoked directly
 if __name__ == "__main__":
@@ -0,0 +1,472 @@
+#!/bin/python3
+
+import concurrent.futures
+import json
+import os
+import random
+import sys
+import time
+
+import magic_number_executer as MNE
+import magic_number_loops as MNL
+import magic_number_optimizer as MNO
+import magic_number_shared_program as MNSP
+import magic_number_specializer as MNPE
+
+# Differential fuzzing of the fast execution engines against the reference
+# interpreter. Every string of digits is a MN program, so random digit strings,
+# random sequences of well-formed statements and mutations of the sample
+# programs are all valid test cases. Each case is run under an instruction
+# budget, with scripted input, by `execute_MN_program` and by every engine being
+# tested, and the output, final stack, termination status and any exception
+# raised are compared. A mismatch is shrunk by delta debugging to a program as
+# small as can be found which still shows it.
+#
+# Cases are numbered, and each is generated from the seed and its own number
+# alone, so any case can be regenerated on its own. Cases are run in batches,
+# in worker processes if asked, with only summaries and mismatches sent back.
+#
+# The snapshot engine is not fuzzed: it runs the prefix of a program without a
+# budget, so random programs would run it forever.
+
+# The instruction budget of every run, unless another is given.
+DEFAULT_BUDGET = 2000
+
+# The number of cases each worker process runs per task.
+BATCH_SIZE = 256
+
+# The greatest number of runs made while shrinking one mismatch.
+SHRINK_RUNS = 2000
+
+# The labels used by generated statements. A few labels shared by many branches
+# make loops likely.
+LABEL_NAMES = ("000000", "000001", "000002", "000003")
+
+# The relative frequency of each opcode in generated statements.
+OPCODE_WEIGHTS = {"001" : 12, "002" : 3, "003" : 2, "004" : 2, "005" : 3, \
+                  "006" : 2, "007" : 5, "008" : 5, "009" : 1, "010" : 1, \
+                  "011" : 1, "012" : 1, "013" : 2, "014" : 2, "015" : 2, \
+                  "016" : 4, "017" : 4, "018" : 2, "019" : 2, "020" : 3, \
+                  "021" : 5}
+
+# Lines of scripted input the generated cases draw from.
+INPUT_LINES = ("0", "1", "2", "3", "7", "10", "-1", "-4", "2.5", "1e3", "", \
+               "a", "hi", "fizz", "12x")
+
+# The directory holding the sample programs, which seed the mutations.
+SAMPLES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+                                 "samples")
+
+# The exceptions which end a run of a MN program early.
+RUN_ERRORS = (Exception, MNE.OutOfScriptedInputException, \
+              MNE.InvalidMNInstructionException, \
+              MNE.MisinterpretedInstructionException, \
+              MNE.StackUnderflowException)
+
+# The sample programs, stripped, loaded by `sample_programs` when first needed.
+samples = None
+
+# How a run ended: what it printed, its final stack, its termination status,
+# and the name of the exception it raised, if any. Stack values are kept as
+# their representations, so that NaN equals NaN and 0.0 differs from -0.0.
+class RunOutcome:
+    def __init__(self, output, stack, status, error = None):
+        self.output = output
+        self.stack = [repr(value) for value in stack]
+        self.status = status
+        self.error = error
+
+    def __eq__(self, other):
+        return (self.output, self.stack, self.status, self.error) == \
+               (other.output, other.stack, other.status, other.error)
+
+    def as_dict(self):
+        return {"output" : self.output, "stack" : self.stack, \
+                "status" : self.status, "error" : self.error}
+
+# A test case: a program, its scripted input, and how many of the input lines
+# the specializer is given as known input.
+class FuzzCase:
+    def __init__(self, source, input_lines, known_lines = 0):
+        self.source = source
+        self.input_lines = input_lines
+        self.known_lines = min(known_lines, len(input_lines))
+
+# Run a function which runs a MN program with captured output, and return its
+# outcome. The interpreter's state is read afterwards, whether it stopped
+# normally or by an exception.
+def capture_outcome(run):
+    error = None
+    try:
+        run()
+    except RUN_ERRORS as exception:
+        error = type(exception).__name__
+    return RunOutcome(MNE.get_captured_output(), MNE.stack, \
+                      MNE.termination_status, error)
+
+# The engines. Each runs a case within an instruction budget and returns its
+# outcome, or None if the engine does not promise to match the reference on it.
+def run_reference(case, max_instructions):
+    def run():
+        # Compiling may fail, which is an outcome like any other
+        MNE.configure_interpreter(False, True, list(case.input_lines), True)
+        program_statements, program_labels = MNE.compile_MN_program(case.source)
+        MNE.run_compiled_MN_program(program_statements, program_labels, \
+                                    list(case.input_lines), max_instructions)
+    return capture_outcome(run)
+
+def run_loop_accelerated(case, max_instructions):
+    def run():
+        MNE.configure_interpreter(False, True, list(case.input_lines), True)
+        MNL.run_accelerated_MN_program(case.source, False, True, \
+                                       list(case.input_lines), True, \
+                                       max_instructions)
+    return capture_outcome(run)
+
+def run_specialized(case, max_instructions):
+    def run():
+        MNE.configure_interpreter(False, True, list(case.input_lines), True)
+        specialized = MNPE.specialize_MN_program( \
+            case.source, list(case.input_lines[:case.known_lines]), None, \
+            max_instructions)
+        MNPE.run_specialized_program( \
+            specialized, True, list(case.input_lines[case.known_lines:]), \
+            True, max_instructions)
+    return capture_outcome(run)
+
+def run_shared_memory(case, max_instructions):
+    def run():
+        MNE.configure_interpreter(False, True, list(case.input_lines), True)
+        program = MNSP.share_MN_program(case.source)
+        try:
+            MNE.configure_interpreter(False, True, list(case.input_lines), \
+                                      True, None, max_instructions)
+            MNE.install_MN_labels(program.labels())
+            MNE.execute_MN_program(program)
+        finally:
+            program.close()
+            program.unlink()
+    return capture_outcome(run)
+
+# The optimized and residual programs execute fewer or more statements than the
+# original, so they can only be held to the reference's outcome when the
+# reference finishes within its budget. They are given enough budget to finish
+# too.
+def run_optimized(case, max_instructions, expected):
+    if expected.status != MNE.COMPLETED:
+        return None
+    def run():
+        MNE.configure_interpreter(False, True, list(case.input_lines), True)
+        program_statements, program_labels = \
+            MNO.compile_optimized_MN_program(case.source)
+        MNE.run_compiled_MN_program(program_statements, program_labels, \
+                                    list(case.input_lines), max_instructions)
+    return capture_outcome(run)
+
+def run_residual(case, max_instructions, expected):
+    if expected.status != MNE.COMPLETED or expected.error is not None:
+        return None
+    known_input = list(case.input_lines[:case.known_lines])
+    specialized = MNPE.specialize_MN_program(case.source, known_input, None, \
+                                             max_instructions)
+    residual = MNPE.residual_source(specialized)
+    if residual is None:
+        return None
+    remaining_input = list(case.input_lines[specialized.consumed_input:])
+    def run():
+        MNE.configure_interpreter(False, True, remaining_input, True)
+        program_statements, program_labels = MNE.compile_MN_program(residual)
+        MNE.run_compiled_MN_program(program_statements, program_labels, \
+                                    remaining_input, \
+                                    max_instructions + len(program_statements))
+    return capture_outcome(run)
+
+# Engines compared on every case, whatever the reference's outcome.
+EXACT_ENGINES = {"loop_accelerated" : run_loop_accelerated, \
+                 "specialized" : run_specialized, \
+                 "shared_memory" : run_shared_memory}
+
+# Engines compared only on cases the reference completes.
+COMPLETING_ENGINES = {"optimized" : run_optimized, \
+                      "residual" : run_residual}
+
+ENGINE_NAMES = tuple(EXACT_ENGINES) + tuple(COMPLETING_ENGINES)
+
+# Run a case on one engine, returning its outcome, or None if it is not
+# comparable with the reference's outcome `expected`.
+def run_engine(engine_name, case, max_instructions, expected):
+    if engine_name in EXACT_ENGINES:
+        return EXACT_ENGINES[engine_name](case, max_instructions)
+    # Preparing these engines' programs may fail where the reference did not
+    try:
+        return COMPLETING_ENGINES[engine_name](case, max_instructions, \
+                                               expected)
+    except RUN_ERRORS as exception:
+        return RunOutcome("", [], MNE.COMPLETED, type(exception).__name__)
+
+# Return true if an engine's outcome on a case differs from the reference's.
+def engine_mismatches(engine_name, case, max_instructions):
+    expected = run_reference(case, max_instructions)
+    actual = run_engine(engine_name, case, max_instructions, expected)
+    return actual is not None and actual != expected
+
+# Return the sample programs, stripped of comments.
+def sample_programs():
+    global samples
+    if samples is None:
+        samples = []
+        if os.path.isdir(SAMPLES_DIRECTORY):
+            for file_name in sorted(os.listdir(SAMPLES_DIRECTORY)):
+                if file_name.endswith(".magic"):
+                    samples.append(MNE.load_MN_file( \
+                        os.path.join(SAMPLES_DIRECTORY, file_name)))
+    return samples
+
+# Return the source of a random well-formed statement.
+def random_statement(rng):
+    opcode = rng.choices(list(OPCODE_WEIGHTS), \
+                         list(OPCODE_WEIGHTS.values()))[0]
+    if opcode == "001":
+        magnitude = rng.choice((0, 1, 1, 2, 3, 5, 10, 32, 65, \
+                                rng.randrange(1000000)))
+        return opcode + rng.choice("0001") + "{:06d}".format(magnitude)
+    if opcode == "002":
+        return opcode + rng.choice("01") + "{:02d}".format(rng.randrange(4)) + \
+               rng.choice("01") + "{:06d}".format(rng.randrange(1000000))
+    if opcode in ("007", "008"):
+        return opcode + rng.choice(LABEL_NAMES)
+    return opcode
+
+# Return a random string of digits, mostly invalid opcodes and no-ops.
+def random_digits(rng):
+    return "".join(rng.choice("0123456789") \
+                   for _ in range(rng.randrange(1, 200)))
+
+# Return a random sequence of well-formed statements.
+def random_statements(rng):
+    return "".join(random_statement(rng) for _ in range(rng.randrange(1, 40)))
+
+# Return a program built around loops: counted loops, which count a value down
+# to zero, and loops whose body is random, each branching back to its label.
+def random_loops(rng):
+    pieces = []
+    for _ in range(rng.randrange(1, 4)):
+        label = rng.choice(LABEL_NAMES)
+        body = "".join(random_statement(rng) \
+                       for _ in range(rng.randrange(6)))
+        if rng.randrange(2):
+            start = "001{}{:06d}".format(rng.choice("01"), rng.randrange(50))
+            step = "001{}{:06d}".format(rng.choice("01"), rng.randrange(4))
+            pieces.append(start + "007" + label + body + step + "016021" + \
+                          "008" + label)
+        else:
+            pieces.append("007" + label + body + "008" + label)
+        pieces.append(random_statements(rng))
+    return "".join(pieces)
+
+# Return a mutation of a program: a changed, inserted, deleted or duplicated
+# span of digits, or part of another program spliced in.
+def mutate(rng, source):
+    if not source:
+        return random_statement(rng)
+    start = rng.randrange(len(source))
+    end = min(len(source), start + rng.randrange(1, 14))
+    mutation = rng.randrange(5)
+    if mutation == 0:
+        return source[:start] + rng.choice("0123456789") + source[start + 1:]
+    if mutation == 1:
+        return source[:start] + random_statement(rng) + source[start:]
+    if mutation == 2:
+        return source[:start] + source[end:]
+    if mutation == 3:
+        return source[:end] + source[start:end] + source[end:]
+    donor = rng.choice(sample_programs() or [random_statements(rng)])
+    donor_start = rng.randrange(len(donor) + 1)
+    return source[:start] + \
+           donor[donor_start : donor_start + rng.randrange(1, 40)] + \
+           source[start:]
+
+# Return a mutated sample or random program.
+def mutated_program(rng):
+    source = rng.choice(sample_programs() or [random_statements(rng)])
+    for _ in range(rng.randrange(1, 6)):
+        source = mutate(rng, source)
+    return source
+
+# Generate case number `case_number` of the cases of a seed.
+def generate_case(seed, case_number):
+    rng = random.Random("{}:{}".format(seed, case_number))
+    generator = rng.choices((random_digits, random_statements, random_loops, \
+                             mutated_program), (1, 3, 3, 3))[0]
+    input_lines = [rng.choice(INPUT_LINES) for _ in range(rng.randrange(5))]
+    return FuzzCase(generator(rng), input_lines, \
+                    rng.randrange(len(input_lines) + 1))
+
+# Delta debugging: return a smaller list of units for which `still_fails`
+# holds, such that removing any one of the chunks last tried makes it pass.
+def delta_debug(units, still_fails):
+    granularity = 2
+    while len(units) >= 2:
+        chunk_size = -(-len(units) // granularity)
+        chunks = [units[start : start + chunk_size] \
+                  for start in range(0, len(units), chunk_size)]
+        reduced = False
+        for index, chunk in enumerate(chunks):
+            if still_fails(chunk):
+                units, granularity, reduced = chunk, 2, True
+                break
+            complement = [unit for other, kept in enumerate(chunks) \
+                          if other != index for unit in kept]
+            if still_fails(complement):
+                units, granularity = complement, max(granularity - 1, 2)
+                reduced = True
+                break
+        if not reduced:
+            if granularity >= len(units):
+                break
+            granularity = min(granularity * 2, len(units))
+    if len(units) == 1 and still_fails([]):
+        return []
+    return units
+
+# Shrink a program for which `still_fails` holds, removing whole statements
+# first and then single digits, within `max_runs` calls of `still_fails`.
+def shrink_program(source, still_fails, max_runs = SHRINK_RUNS):
+    runs = [0]
+    def check(candidate):
+        if runs[0] >= max_runs:
+            return False
+        runs[0] += 1
+        return still_fails(candidate)
+    statements = delta_debug(MNE.parse_MN_program_source(source), \
+                             lambda units: check("".join(units)))
+    source = "".join(statements)
+    return "".join(delta_debug(list(source), \
+                               lambda units: check("".join(units))))
+
+# Counts of the cases run and compared, and the mismatches found.
+class FuzzReport:
+    def __init__(self, engine_names):
+        self.cases = 0
+        self.compared = {engine_name : 0 for engine_name in engine_names}
+        self.mismatches = []
+        self.elapsed = 0.0
+
+    # Add the results of a batch.
+    def add(self, batch):
+        self.cases += batch.cases
+        for engine_name, count in batch.compared.items():
+            self.compared[engine_name] += count
+        self.mismatches += batch.mismatches
+
+    def as_dict(self):
+        return {"cases" : self.cases, "compared" : dict(self.compared), \
+                "mismatches" : len(self.mismatches), \
+                "elapsed" : self.elapsed, \
+                "cases_per_second" : \
+                    self.cases / self.elapsed if self.elapsed > 0 else 0.0}
+
+# Run `count` cases from `first_case` on, comparing every engine with the
+# reference, and return a report of them.
+def fuzz_batch(seed, first_case, count, engine_names = ENGINE_NAMES, \
+               max_instructions = DEFAULT_BUDGET, shrink = True):
+    report = FuzzReport(engine_names)
+    for case_number in range(first_case, first_case + count):
+        case = generate_case(seed, case_number)
+        expected = run_reference(case, max_instructions)
+        report.cases += 1
+        for engine_name in engine_names:
+            actual = run_engine(engine_name, case, max_instructions, expected)
+            if actual is None:
+                continue
+            report.compared[engine_name] += 1
+            if actual == expected:
+                continue
+            mismatch = {"engine" : engine_name, "seed" : seed, \
+                        "case" : case_number, "source" : case.source, \
+                        "input" : case.input_lines, \
+                        "known_lines" : case.known_lines, \
+                        "expected" : expected.as_dict(), \
+                        "actual" : actual.as_dict()}
+            if shrink:
+                def still_fails(source):
+                    return engine_mismatches(engine_name, \
+                        FuzzCase(source, case.input_lines, case.known_lines), \
+                        max_instructions)
+                mismatch["shrunk_source"] = \
+                    shrink_program(case.source, still_fails)
+            report.mismatches.append(mismatch)
+    return report
+
+# Run `cases` cases of a seed on the given engines. With `workers` of zero they
+# run in this process, otherwise in that many worker processes, `BATCH_SIZE`
+# cases per task. Return a report of them.
+def fuzz(cases, seed = 0, engine_names = ENGINE_NAMES, workers = 0, \
+         max_instructions = DEFAULT_BUDGET, shrink = True):
+    for engine_name in engine_names:
+        if engine_name not in ENGINE_NAMES:
+            raise ValueError("Unknown engine \"{}\"; expected one of {}" \
+                             .format(engine_name, ", ".join(ENGINE_NAMES)))
+    start = time.perf_counter()
+    report = FuzzReport(engine_names)
+    batches = [(first_case, min(BATCH_SIZE, cases - first_case)) \
+               for first_case in range(0, cases, BATCH_SIZE)]
+    if workers == 0:
+        for first_case, count in batches:
+            report.add(fuzz_batch(seed, first_case, count, engine_names, \
+                                  max_instructions, shrink))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(fuzz_batch, seed, first_case, count, \
+                                       engine_names, max_instructions, shrink) \
+                       for first_case, count in batches]
+            for future in futures:
+                report.add(future.result())
+    report.elapsed = time.perf_counter() - start
+    return report
+
+# Fuzz from the command line, writing each mismatch as a JSON line to standard
+# out and a summary to standard error. Exit with status 1 if any were found.
+def run_fuzzer_from_cli(arguments):
+    usage = "Usage: ./magic_number_fuzzer.py [--cases N] [--seed S] " + \
+            "[--workers N] [--budget N] [--engine NAME]... [--no-shrink]"
+    cases = 10000
+    seed = 0
+    workers = 0
+    max_instructions = DEFAULT_BUDGET
+    engine_names = []
+    shrink = True
+    arguments = arguments[1:]
+    while arguments:
+        if arguments[0] == "--no-shrink":
+            shrink = False
+            arguments = arguments[1:]
+            continue
+        if len(arguments) < 2:
+            print(usage)
+            sys.exit(1)
+        option, value = arguments[0], arguments[1]
+        if option == "--engine" and value in ENGINE_NAMES:
+            engine_names.append(value)
+        elif option == "--seed":
+            seed = value
+        elif option in ("--cases", "--workers", "--budget") and value.isdigit():
+            if option == "--cases":
+                cases = int(value)
+            elif option == "--workers":
+                workers = int(value)
+            else:
+                max_instructions = int(value)
+        else:
+            print(usage)
+            sys.exit(1)
+        arguments = arguments[2:]
+    report = fuzz(cases, seed, tuple(engine_names) or ENGINE_NAMES, workers, \
+                  max_instructions, shrink)
+    for mismatch in report.mismatches:
+        print(json.dumps(mismatch))
+    print(json.dumps(report.as_dict()), file = sys.stderr)
+    sys.exit(1 if report.mismatches else 0)
+
+if __name__ == "__main__":
+    run_fuzzer_from_cli(sys.argv)
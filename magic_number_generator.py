@@ -0,0 +1,231 @@
+#!/bin/python3
+
+import random
+import sys
+
+# Generation of synthetic MN programs for scaling tests. Programs of a chosen
+# shape are generated to roughly a chosen size, from a few kilobytes up to
+# hundreds of megabytes, together with the input they read and the output they
+# are known to produce. The same shape, size, seed and options always produce
+# the same program.
+
+# Every shape is a function taking the target size in characters, a random
+# number generator and shape-specific options, and yielding triples of
+# (source text, expected output, input lines). Concatenating the pieces gives
+# the program, its expected output and its input. Output pieces are yielded in
+# the order the program prints them, which is not necessarily source order.
+
+# The number of blocks yielded per piece by shapes which repeat a block many
+# times, to keep generation fast without holding the whole program in memory.
+BLOCKS_PER_PIECE = 4096
+
+# Return the source of a 001 "push integer" instruction for an integer with at
+# most six digits.
+def push_integer_source(integer):
+    sign = "1" if integer < 0 else "0"
+    return "001" + sign + "{:06d}".format(abs(integer))
+
+# Print a newline, so that the values a program prints can be told apart.
+PRINT_NEWLINE = push_integer_source(10) + "006"
+
+# Code which leaves the stack as it found it.
+NEUTRAL_BLOCK = push_integer_source(2) + push_integer_source(3) + "016020\n"
+
+# Words used to make comments. Comments may not contain digits.
+COMMENT_WORDS = ["push", "the", "value", "then", "add", "print", "result", \
+                 "stack", "top", "loop", "label", "branch", "magic", "number"]
+
+# Return the source and output of a random arithmetic block which computes a
+# value from two constants and prints it on its own line.
+def arithmetic_block(rng):
+    operand_1 = rng.randint(-999999, 999999)
+    operand_2 = rng.randint(-999999, 999999)
+    opcode, result = rng.choice([("016", float(operand_1) + float(operand_2)), \
+                                 ("017", float(operand_1) - float(operand_2)), \
+                                 ("018", float(operand_1) * float(operand_2))])
+    # The first operand is popped first, so it is pushed last
+    source = push_integer_source(operand_2) + push_integer_source(operand_1) + \
+             opcode + "005" + PRINT_NEWLINE + "\n"
+    return source, str(result) + "\n"
+
+# Straight-line arithmetic: constants are combined and printed, with no
+# branches or input.
+def straight_line_shape(size, rng, options):
+    generated = 0
+    while generated < size:
+        sources = []
+        outputs = []
+        for _ in range(BLOCKS_PER_PIECE):
+            source, output = arithmetic_block(rng)
+            sources.append(source)
+            outputs.append(output)
+            generated += len(source)
+            if generated >= size:
+                break
+        yield "".join(sources), "".join(outputs), []
+
+# Straight-line arithmetic buried in comments. `comment_ratio` is the number of
+# comment characters per character of code.
+def comment_heavy_shape(size, rng, options):
+    comment_ratio = options.get("comment_ratio", 4)
+    generated = 0
+    while generated < size:
+        pieces = []
+        outputs = []
+        for _ in range(BLOCKS_PER_PIECE):
+            source, output = arithmetic_block(rng)
+            comment = []
+            comment_length = 0
+            while comment_length < comment_ratio * len(source):
+                word = rng.choice(COMMENT_WORDS)
+                comment.append(word)
+                comment_length += len(word) + 1
+            pieces.append(" ".join(comment) + "\n" + source)
+            outputs.append(output)
+            generated += len(pieces[-1])
+            if generated >= size:
+                break
+        yield "".join(pieces), "".join(outputs), []
+
+# Input-heavy programs: every block reads a line with 003 "read float" or 004
+# "read string" and prints it back on its own line. `line_length` is the
+# longest string read.
+def input_heavy_shape(size, rng, options):
+    line_length = options.get("line_length", 20)
+    letters = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ !?"
+    generated = 0
+    while generated < size:
+        sources = []
+        outputs = []
+        input_lines = []
+        for _ in range(BLOCKS_PER_PIECE):
+            if rng.random() < 0.5:
+                line = "".join(rng.choice(letters) \
+                               for _ in range(rng.randint(0, line_length)))
+                # Discard the success flag, then print every character
+                source = "004020" + "006" * len(line) + PRINT_NEWLINE + "\n"
+                output = line + "\n"
+            else:
+                line = str(rng.randint(-999999, 999999) / 100)
+                source = "003020005" + PRINT_NEWLINE + "\n"
+                output = str(float(line)) + "\n"
+            sources.append(source)
+            outputs.append(output)
+            input_lines.append(line)
+            generated += len(source)
+            if generated >= size:
+                break
+        yield "".join(sources), "".join(outputs), input_lines
+
+# Stack-deep programs: push as many values as the size allows, then pop and
+# print them all. Values are derived from their position so that they can be
+# regenerated in reverse without storing them.
+def stack_deep_shape(size, rng, options):
+    offset = rng.randrange(1000000)
+    value = lambda index: (index * 7919 + offset) % 1000000
+    push_length = len(push_integer_source(0)) + 1
+    print_length = len("005" + PRINT_NEWLINE) + 1
+    depth = max(1, size // (push_length + print_length))
+    for start in range(0, depth, BLOCKS_PER_PIECE):
+        end = min(depth, start + BLOCKS_PER_PIECE)
+        yield "".join(push_integer_source(value(index)) + "\n" \
+                      for index in range(start, end)), "", []
+    for start in range(depth - 1, -1, -BLOCKS_PER_PIECE):
+        end = max(-1, start - BLOCKS_PER_PIECE)
+        yield ("005" + PRINT_NEWLINE + "\n") * (start - end), \
+              "".join(str(float(value(index))) + "\n" \
+                      for index in range(start, end, -1)), []
+
+# Nested counted loops built from 007 "create label" and 008 "conditional
+# branch". There are `depth` loops, each running `iterations` times, and the
+# innermost loop body is padded with stack-neutral arithmetic to reach the
+# size. The innermost body prints a marker value on each pass.
+def nested_loops_shape(size, rng, options):
+    depth = options.get("depth", 3)
+    iterations = options.get("iterations", 2)
+    marker = rng.randint(1, 999999)
+    headers = [push_integer_source(iterations) + "007{:06d}\n".format(level) \
+               for level in range(depth)]
+    # Count the counter down, and loop again unless it reached zero
+    footers = [push_integer_source(-1) + "016021008{:06d}\n".format(level) + \
+               "020\n" for level in reversed(range(depth))]
+    body = push_integer_source(marker) + "005" + PRINT_NEWLINE + "\n"
+    overhead = len("".join(headers)) + len(body) + len("".join(footers))
+    padding = max(0, size - overhead) // len(NEUTRAL_BLOCK)
+    yield "".join(headers) + body, "", []
+    for start in range(0, padding, BLOCKS_PER_PIECE):
+        yield NEUTRAL_BLOCK * min(BLOCKS_PER_PIECE, padding - start), "", []
+    yield "".join(footers), "", []
+    passes = iterations ** depth
+    line = str(float(marker)) + "\n"
+    for start in range(0, passes, BLOCKS_PER_PIECE):
+        yield "", line * min(BLOCKS_PER_PIECE, passes - start), []
+
+SHAPES = {"straight_line" : straight_line_shape, \
+          "comment_heavy" : comment_heavy_shape, \
+          "input_heavy" : input_heavy_shape, \
+          "stack_deep" : stack_deep_shape, \
+          "nested_loops" : nested_loops_shape}
+
+# A generated program, the lines of input it reads and the output it produces.
+class GeneratedWorkload:
+    def __init__(self, source, input_lines, expected_output):
+        self.source = source
+        self.input_lines = input_lines
+        self.expected_output = expected_output
+
+# Yield the pieces of a program of the given shape.
+def generate_pieces(shape, size, seed = 0, **options):
+    if shape not in SHAPES:
+        raise ValueError("Unknown workload shape \"{}\"; expected one of {}" \
+                         .format(shape, ", ".join(SHAPES)))
+    return SHAPES[shape](size, random.Random(seed), options)
+
+# Generate a program of about `size` characters in memory.
+def generate_workload(shape, size, seed = 0, **options):
+    sources = []
+    outputs = []
+    input_lines = []
+    for source, output, lines in generate_pieces(shape, size, seed, **options):
+        sources.append(source)
+        outputs.append(output)
+        input_lines.extend(lines)
+    return GeneratedWorkload("".join(sources), input_lines, "".join(outputs))
+
+# Generate a program of about `size` characters straight to disk, using
+# constant memory however large it is. The program is written to `path`, its
+# input to `path` + ".input", one line per line, and its expected output to
+# `path` + ".expected". Return the number of characters in the program.
+def write_workload(path, shape, size, seed = 0, **options):
+    written = 0
+    with open(path, "w") as source_file, \
+         open(path + ".input", "w") as input_file, \
+         open(path + ".expected", "w") as expected_file:
+        for source, output, lines in generate_pieces(shape, size, seed, \
+                                                     **options):
+            source_file.write(source)
+            expected_file.write(output)
+            for line in lines:
+                input_file.write(line + "\n")
+            written += len(source)
+    return written
+
+# Parse a size such as "4096", "64K", "16M" or "1G".
+def parse_size(text):
+    multipliers = {"K" : 1024, "M" : 1024 ** 2, "G" : 1024 ** 3}
+    suffix = text[-1:].upper()
+    if suffix in multipliers:
+        return int(text[:-1]) * multipliers[suffix]
+    return int(text)
+
+# Generate a workload file from the command line.
+def run_generator_from_cli(arguments):
+    if len(arguments) not in (4, 5):
+        print("Usage: ./magic_number_generator.py shape size output_file " + \
+              "[seed]\nShapes: " + ", ".join(SHAPES))
+        sys.exit(1)
+    seed = int(arguments[4]) if len(arguments) == 5 else 0
+    write_workload(arguments[3], arguments[1], parse_size(arguments[2]), seed)
+
+if __name__ == "__main__":
+    run_generator_from_cli(sys.argv)
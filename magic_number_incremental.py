@@ -0,0 +1,236 @@
+#!/bin/python3
+
+import bisect
+
+import magic_number_executer as MNE
+
+# Incremental parsing of MN programs for live editing. After an edit, rather
+# than splitting the whole program into statements and declaring every label
+# again, decoding restarts shortly before the edit and stops as soon as it
+# falls back into step with the previous decoding, past the edit. The statement
+# list and label table are patched in place.
+#
+# Offsets are positions in the digit-only program source, as returned by
+# `load_MN_file`. Non-digits in inserted text are ignored, just as they are when
+# a file is loaded.
+
+# Decoding can only restart at the start of an instruction. The position and
+# statement number of every CHECKPOINT_INTERVAL-th instruction is remembered so
+# that a restart point near any edit can be found quickly.
+CHECKPOINT_INTERVAL = 256
+
+# Decode the instruction starting at `index`, in the same way as
+# `parse_MN_program_source`. Return its length and the statement it forms, or
+# None if the opcode is invalid and the digits are skipped.
+def decode_instruction(program_source, index):
+    opcode = program_source[index : index + 3]
+    if opcode not in MNE.OPCODES:
+        return len(opcode), None
+    instruction = program_source[index : index + \
+                                 MNE.INSTRUCTION_LENGTHS[opcode]]
+    return len(instruction), instruction
+
+# Return true if a statement declares a label. A 007 "create label" cut short by
+# the end of the program declares nothing.
+def is_label_declaration(instruction):
+    return instruction[:3] == "007" and \
+           len(instruction) == MNE.INSTRUCTION_LENGTHS["007"]
+
+# A MN program which keeps its statements and labels up to date as its source
+# is edited. `statements` and `labels` are always what `compile_MN_program`
+# would return for `source`. If the source ends in a label declaration cut
+# short, `compile_MN_program` fails, and so does running the program.
+class IncrementalMNProgram:
+    def __init__(self, program_source):
+        self.source = ""
+        self.statements = []
+        # The statement number and name of every label declaration, in order.
+        # The last declaration of a label is the one that counts.
+        self.declaration_statements = []
+        self.declaration_names = []
+        # The label table, patched along with the declarations
+        self.label_table = {}
+        self.checkpoint_positions = [0]
+        self.checkpoint_statements = [0]
+        self.apply_edit(0, 0, program_source)
+
+    # Replace `removed_length` digits of the source starting at `offset` with
+    # the digits of `inserted_text`. Return the number of the first statement
+    # that changed, how many statements were removed there and how many were
+    # inserted in their place.
+    def apply_edit(self, offset, removed_length, inserted_text):
+        old_source = self.source
+        if offset < 0 or removed_length < 0 or \
+           offset + removed_length > len(old_source):
+            raise ValueError("Edit of {} digits at offset {} is outside a " \
+                             "program of {} digits".format(removed_length, \
+                             offset, len(old_source)))
+        inserted = MNE.strip_MN_source(inserted_text)
+        new_source = old_source[:offset] + inserted + \
+                     old_source[offset + removed_length:]
+        delta = len(inserted) - removed_length
+        old_edit_end = offset + removed_length
+        new_edit_end = offset + len(inserted)
+        # Restart at the last checkpoint at or before the edit
+        checkpoint = bisect.bisect_right(self.checkpoint_positions, offset) - 1
+        start = self.checkpoint_positions[checkpoint]
+        first_statement = self.checkpoint_statements[checkpoint]
+        # Decode the old and new sources side by side, always advancing
+        # whichever is behind, until both are past the edit and have reached
+        # the same instruction boundary. Everything after that decodes the same
+        # as before.
+        old_position = new_position = start
+        old_statement_count = 0
+        new_statements = []
+        new_checkpoints = []
+        new_instruction_count = 0
+        while True:
+            old_done = old_position >= len(old_source)
+            new_done = new_position >= len(new_source)
+            if old_done and new_done:
+                break
+            shifted_position = new_position - delta
+            if old_position >= old_edit_end and \
+               new_position >= new_edit_end and \
+               shifted_position == old_position:
+                break
+            if not new_done and (old_done or shifted_position <= old_position):
+                # Remember a checkpoint every so often in the new decoding
+                if new_instruction_count % CHECKPOINT_INTERVAL == 0 and \
+                   new_position != start:
+                    new_checkpoints.append((new_position, first_statement + \
+                                            len(new_statements)))
+                new_instruction_count += 1
+                length, instruction = decode_instruction(new_source, \
+                                                         new_position)
+                if instruction is not None:
+                    new_statements.append(instruction)
+                new_position += length
+                # Advance both decodings across the same stretch of the edit
+                if shifted_position != old_position:
+                    continue
+            if not old_done:
+                length, instruction = decode_instruction(old_source, \
+                                                         old_position)
+                if instruction is not None:
+                    old_statement_count += 1
+                old_position += length
+        # Statements re-decoded without change at either end do not count as
+        # changed
+        old_statements = self.statements[first_statement : first_statement + \
+                                         old_statement_count]
+        same_at_start = 0
+        while same_at_start < min(len(old_statements), len(new_statements)) \
+              and old_statements[same_at_start] == \
+                  new_statements[same_at_start]:
+            same_at_start += 1
+        same_at_end = 0
+        while same_at_end < min(len(old_statements), \
+                                len(new_statements)) - same_at_start and \
+              old_statements[-1 - same_at_end] == \
+                  new_statements[-1 - same_at_end]:
+            same_at_end += 1
+        first_statement += same_at_start
+        old_statement_count -= same_at_start + same_at_end
+        new_statements = new_statements[same_at_start : \
+                                        len(new_statements) - same_at_end]
+        self.source = new_source
+        self.statements[first_statement : first_statement + \
+                        old_statement_count] = new_statements
+        self.update_checkpoints(checkpoint, old_position, delta, \
+                                len(new_statements) - old_statement_count, \
+                                new_checkpoints)
+        self.update_labels(first_statement, old_statement_count, \
+                           new_statements)
+        return first_statement, old_statement_count, len(new_statements)
+
+    # The label table, as `compile_MN_program` would return it. Later
+    # declarations of a label override earlier ones, as in `declare_MN_labels`.
+    @property
+    def labels(self):
+        return self.label_table
+
+    # Return the label declaration cut short by the end of the program, or None
+    # if there is none. Only the last statement can be cut short.
+    def truncated_declaration(self):
+        if self.statements and self.statements[-1][:3] == "007" and \
+           not is_label_declaration(self.statements[-1]):
+            return self.statements[-1]
+        return None
+
+    # Drop the checkpoints in the re-decoded stretch, add the new ones there,
+    # and shift those after it. A checkpoint which would end up at the end of
+    # the source is dropped too: the digits before it may be a fragment cut
+    # short by the end of the program, which digits added later would join.
+    def update_checkpoints(self, checkpoint, old_end, position_delta, \
+                           statement_delta, new_checkpoints):
+        later = bisect.bisect_left(self.checkpoint_positions, old_end, \
+                                   checkpoint + 1)
+        end = bisect.bisect_left(self.checkpoint_positions, \
+                                 len(self.source) - position_delta, later)
+        later_positions = [position + position_delta for position in \
+                           self.checkpoint_positions[later:end]]
+        later_statements = [statement + statement_delta for statement in \
+                            self.checkpoint_statements[later:end]]
+        self.checkpoint_positions[checkpoint + 1:] = \
+            [position for position, _ in new_checkpoints] + later_positions
+        self.checkpoint_statements[checkpoint + 1:] = \
+            [statement for _, statement in new_checkpoints] + later_statements
+
+    # Patch the label declarations and the label table for statements replaced
+    # by an edit.
+    def update_labels(self, first_statement, old_statement_count, \
+                      new_statements):
+        old_end = first_statement + old_statement_count
+        statement_delta = len(new_statements) - old_statement_count
+        low = bisect.bisect_left(self.declaration_statements, first_statement)
+        high = bisect.bisect_left(self.declaration_statements, old_end)
+        added_statements = []
+        added_names = []
+        for index, instruction in enumerate(new_statements):
+            if is_label_declaration(instruction):
+                added_statements.append(first_statement + index)
+                added_names.append(instruction[3:])
+        if low == high and not added_names and statement_delta == 0:
+            return
+        # Labels declared in the replaced or the new statements, unless a
+        # declaration after the edit overrides them
+        changed_names = {name for name in \
+                         self.declaration_names[low:high] + added_names \
+                         if self.label_table.get(name, -1) < old_end}
+        later_statements = self.declaration_statements[high:]
+        if statement_delta != 0:
+            for name, statement in zip(self.declaration_names[high:], \
+                                       later_statements):
+                if self.label_table[name] == statement:
+                    self.label_table[name] = statement + statement_delta
+            later_statements = [statement + statement_delta for statement in \
+                                later_statements]
+        self.declaration_statements[low:] = added_statements + later_statements
+        self.declaration_names[low:high] = added_names
+        # The last declaration of each changed label at or before the new
+        # statements is now the one that counts
+        for name in changed_names:
+            index = low + len(added_names) - 1
+            while index >= 0 and self.declaration_names[index] != name:
+                index -= 1
+            if index >= 0:
+                self.label_table[name] = self.declaration_statements[index]
+            else:
+                del self.label_table[name]
+
+    # Run the program as `run_interpreter_from_python` would.
+    def run(self, is_debugging, is_scripting = False, preset_input = []):
+        MNE.configure_interpreter(is_debugging, is_scripting, preset_input)
+        # Debug traces include the label declarations, as in a normal run
+        if is_debugging:
+            MNE.declare_MN_labels(self.statements)
+        else:
+            MNE.install_MN_labels(self.labels)
+            # Declaring the labels fails on a declaration cut short
+            truncated = self.truncated_declaration()
+            if truncated is not None:
+                raise MNE.InvalidMNInstructionException(truncated)
+        MNE.execute_MN_program(self.statements)
+        if MNE.debug:
+            MNE.print_debugging_information()
@@ -0,0 +1,313 @@
+#!/bin/python3
+
+import magic_number_executer as MNE
+
+# Loop idiom recognition. Many MN programs spend their time in small counted
+# loops: a 007 "create label", a straight-line body without input or output,
+# and a 008 "conditional branch" back to the label. Such a loop is analysed once
+# by executing its body symbolically, giving an expression for every value it
+# leaves on the stack and for the branch condition. The loop is then run by a
+# Python recurrence generated from those expressions, many iterations per call,
+# instead of statement by statement. Loops which only count a value towards
+# zero, however much dead arithmetic they do along the way, are run in closed
+# form.
+#
+# Every operation the body may contain is mirrored exactly, so the output and
+# final stack are identical to `execute_MN_program`. A loop is only run in bulk
+# while the stack is deep enough that no operation in its body underflows;
+# anything else falls back to ordinary execution.
+
+# The opcodes which may appear in the body of an accelerated loop. Division and
+# remainder are left out since they swallow exceptions, and input, output and
+# branches since they are not straight-line and pure.
+BODY_OPCODES = ("001", "002", "007", "009", "010", "011", "012", "013", "014", \
+                "015", "016", "017", "018", "020", "021")
+
+# The Python expression each binary operation computes from the value popped
+# first, `a`, and the value popped second, `b`, as in the handlers.
+BINARY_EXPRESSIONS = {"011" : "(1.0 if abs({a}) >= 0.0001 and " \
+                              "abs({b}) >= 0.0001 else 0.0)", \
+                      "012" : "(1.0 if abs({a}) >= 0.0001 or " \
+                              "abs({b}) >= 0.0001 else 0.0)", \
+                      "013" : "(1.0 if {a} < {b} else 0.0)", \
+                      "014" : "(1.0 if {a} > {b} else 0.0)", \
+                      "015" : "(1.0 if abs({a} - {b}) < 0.0001 else 0.0)", \
+                      "016" : "({a} + {b})", \
+                      "017" : "({a} - {b})", \
+                      "018" : "({a} * {b})"}
+
+# The Python expression each unary operation computes from the value it pops.
+UNARY_EXPRESSIONS = {"009" : "(1.0 if abs({a}) >= 0.0001 else 0.0)", \
+                     "010" : "(0.0 if abs({a}) >= 0.0001 else 1.0)"}
+
+# Integers up to this size are exact as floats, so counting with them in
+# closed form gives the same values as counting step by step.
+EXACT_INTEGER_LIMIT = 2 ** 53
+
+# Return the value pushed by a 001 "push integer" or 002 "push float"
+# instruction, computed as `push_integer` and `push_float` do, or None if the
+# instruction is invalid.
+def constant_value(instruction):
+    opcode = instruction[:3]
+    if opcode == "001":
+        sign = instruction[3]
+        if sign != "0" and sign != "1":
+            return None
+        return float((1 if sign == "0" else -1) * int(instruction[4:]))
+    exponent_sign = instruction[3]
+    mantissa_sign = instruction[6]
+    if exponent_sign not in ("0", "1") and mantissa_sign not in ("0", "1"):
+        return None
+    exponent = (1 if exponent_sign == "0" else -1) * int(instruction[4:6])
+    mantissa = (1 if mantissa_sign == "0" else -1) * int(instruction[7:13])
+    return float(mantissa * 10 ** exponent)
+
+# The symbolic execution of a loop body. Values are nodes: ("input", j) is the
+# j-th value from the top of the stack when the iteration starts,
+# ("constant", value) a pushed constant, and (opcode, operand, ...) the result
+# of an operation.
+class SymbolicBody:
+    def __init__(self):
+        self.stack = []
+        # The number of values the iteration takes from the stack it starts on
+        self.inputs = 0
+        # The greatest height the stack reaches above the height it starts at
+        self.peak = 0
+
+    def pop(self):
+        if self.stack:
+            return self.stack.pop()
+        node = ("input", self.inputs)
+        self.inputs += 1
+        return node
+
+    def push(self, node):
+        self.stack.append(node)
+        self.peak = max(self.peak, len(self.stack) - self.inputs)
+
+    # Execute one statement symbolically. Return false if it cannot be.
+    def execute(self, instruction):
+        opcode = instruction[:3]
+        if opcode not in BODY_OPCODES or \
+           len(instruction) != MNE.INSTRUCTION_LENGTHS[opcode]:
+            return False
+        if opcode in ("001", "002"):
+            value = constant_value(instruction)
+            if value is None:
+                return False
+            self.push(("constant", value))
+        elif opcode in UNARY_EXPRESSIONS:
+            self.push((opcode, self.pop()))
+        elif opcode in BINARY_EXPRESSIONS:
+            operand_1 = self.pop()
+            operand_2 = self.pop()
+            self.push((opcode, operand_1, operand_2))
+        elif opcode == "020":
+            self.pop()
+        elif opcode == "021":
+            node = self.pop()
+            self.push(node)
+            self.push(node)
+        return True
+
+# A recognized loop, from the label at statement `start` to the branch back to
+# it at statement `end`, with the code that runs it in bulk.
+class LoopAccelerator:
+    def __init__(self, label, start, end, symbolic_body):
+        self.label = label
+        self.start = start
+        self.end = end
+        # Statements executed per iteration: the label, the body and the branch
+        self.iteration_length = end - start + 1
+        self.inputs = symbolic_body.inputs
+        self.peak = symbolic_body.peak
+        self.outputs = len(symbolic_body.stack)
+        self.kind = "recurrence"
+        self.step = None
+        self.counter_step = None
+        self.runs = 0
+        self.iterations = 0
+        condition = symbolic_body.condition
+        # A counter adding a constant to itself and branching on the result
+        if self.inputs == 1 and self.outputs == 1 and \
+           symbolic_body.stack[0] == condition and condition[0] == "016":
+            operands = [condition[1], condition[2]]
+            if ("input", 0) in operands:
+                operands.remove(("input", 0))
+                if operands[0][0] == "constant" and \
+                   operands[0][1].is_integer():
+                    self.kind = "closed_form"
+                    self.counter_step = int(operands[0][1])
+        self.step = generate_step(symbolic_body.stack, condition, self.inputs)
+
+    # Run as many iterations as `available` statements allow, starting at the
+    # label. Return the number of statements executed and where execution
+    # continues: at the label if the loop may go around again, or after the
+    # branch if it has ended.
+    def __call__(self, available):
+        iterations = available // self.iteration_length
+        stack = MNE.stack
+        if iterations <= 0 or len(stack) < self.inputs:
+            return 0, self.start
+        first_depth = len(stack)
+        done = None
+        if self.kind == "closed_form":
+            done = self.count(stack, iterations)
+        if done is None:
+            done = self.step(stack, iterations)
+        completed, looping = done
+        if completed == 0:
+            return 0, self.start
+        # The deepest the stack went is in the first or the last iteration,
+        # depending on whether the loop grows or shrinks it
+        last_depth = len(stack) - self.outputs + self.inputs
+        deepest = max(first_depth, last_depth) + self.peak
+        if deepest > MNE.peak_stack_depth:
+            MNE.peak_stack_depth = deepest
+        self.runs += 1
+        self.iterations += completed
+        next_statement = self.start if looping else self.end + 1
+        return completed * self.iteration_length, next_statement
+
+    # Run a counting loop in closed form. Return the number of iterations run
+    # and whether the loop goes on, or None if the counter is not an integer
+    # small enough to be exact.
+    def count(self, stack, iterations):
+        counter = stack[-1]
+        step = self.counter_step
+        if not counter.is_integer() or abs(counter) > EXACT_INTEGER_LIMIT:
+            return None
+        # The loop ends on the iteration which brings the counter to zero
+        if step == 0:
+            ending = 1 if counter == 0 else None
+        elif -int(counter) % step == 0 and -int(counter) // step > 0:
+            ending = -int(counter) // step
+        else:
+            ending = None
+        looping = True
+        if ending is not None and ending <= iterations:
+            iterations = ending
+            looping = False
+        final = counter + float(iterations * step)
+        if abs(final) > EXACT_INTEGER_LIMIT:
+            return None
+        stack[-1] = final
+        return iterations, looping
+
+# Generate the function running iterations of a loop: given the stack and a
+# number of iterations, it runs at most that many and returns how many it ran
+# and whether the loop goes on. It stops early, leaving the loop at its label,
+# if the stack becomes too shallow for an iteration to run without underflow.
+def generate_step(outputs, condition, inputs):
+    names = {}
+    constants = {}
+    lines = []
+    def name_of(node):
+        if node in names:
+            return names[node]
+        kind = node[0]
+        if kind == "input":
+            name = "i{}".format(node[1])
+        elif kind == "constant":
+            name = "c{}".format(len(constants))
+            constants[name] = node[1]
+        else:
+            operands = [name_of(operand) for operand in node[1:]]
+            name = "t{}".format(len(names))
+            if kind in UNARY_EXPRESSIONS:
+                expression = UNARY_EXPRESSIONS[kind].format(a = operands[0])
+            else:
+                expression = BINARY_EXPRESSIONS[kind].format(a = operands[0], \
+                                                             b = operands[1])
+            lines.append("        {} = {}".format(name, expression))
+        names[node] = name
+        return name
+    output_names = [name_of(node) for node in outputs]
+    condition_name = name_of(condition)
+    source = ["def step(stack, iterations):", \
+              "    completed = 0", \
+              "    while completed < iterations:", \
+              "        if len(stack) < {}:".format(inputs), \
+              "            return completed, True"]
+    source += ["        i{} = stack[-{}]".format(index, index + 1) \
+               for index in range(inputs)]
+    source += lines
+    results = "[" + ", ".join(output_names) + "]"
+    if inputs == 0:
+        source.append("        stack.extend({})".format(results))
+    else:
+        source.append("        stack[-{}:] = {}".format(inputs, results))
+    source += ["        completed += 1", \
+               "        if abs({}) < 0.0001:".format(condition_name), \
+               "            return completed, False", \
+               "    return completed, True"]
+    namespace = dict(constants)
+    exec("\n".join(source), namespace)
+    return namespace["step"]
+
+# Return an accelerator for the loop whose branch back to its label is the
+# statement `end`, or None if the loop is not one that can be accelerated.
+def recognize_loop(program_statements, program_labels, end):
+    branch = program_statements[end]
+    label = branch[3:]
+    if branch[:3] != "008" or len(branch) != MNE.INSTRUCTION_LENGTHS["008"] or \
+       program_labels.get(label, end) >= end:
+        return None
+    start = program_labels[label]
+    symbolic_body = SymbolicBody()
+    for instruction in program_statements[start + 1 : end]:
+        if not symbolic_body.execute(instruction):
+            return None
+    # The branch pops its condition
+    symbolic_body.condition = symbolic_body.pop()
+    # Expressions nested too deeply to generate code for are left alone
+    try:
+        return LoopAccelerator(label, start, end, symbolic_body)
+    except RecursionError:
+        return None
+
+# Find the loops of a compiled program which can be accelerated, keyed by the
+# statement number of their label.
+def find_loop_accelerators(program_statements, program_labels):
+    accelerators = {}
+    for end, instruction in enumerate(program_statements):
+        if instruction[:3] != "008":
+            continue
+        accelerator = recognize_loop(program_statements, program_labels, end)
+        if accelerator is not None and accelerator.start not in accelerators:
+            accelerators[accelerator.start] = accelerator
+    return accelerators
+
+# Accelerate the loops of a compiled program in the runs which follow. This
+# must be called after `configure_interpreter`, which removes accelerators.
+# Return the accelerators installed.
+def install_loop_accelerators(program_statements, program_labels):
+    MNE.loop_accelerators = find_loop_accelerators(program_statements, \
+                                                   program_labels)
+    return MNE.loop_accelerators
+
+# Describe the loops which were run in bulk: their label, first and last
+# statements, how they were run, how often and for how many iterations.
+def report_accelerated_loops(accelerators):
+    return [{"label" : accelerator.label, "start" : accelerator.start, \
+             "end" : accelerator.end, "kind" : accelerator.kind, \
+             "runs" : accelerator.runs, \
+             "iterations" : accelerator.iterations} \
+            for accelerator in accelerators.values() if accelerator.runs > 0]
+
+# A drop-in replacement for `run_interpreter_from_python` which accelerates the
+# loops it recognizes. Return the accelerators, so that the loops which were
+# accelerated can be reported.
+def run_accelerated_MN_program(program_source, is_debugging, \
+                               is_scripting = False, preset_input = [], \
+                               is_capturing = False, max_instructions = None):
+    MNE.configure_interpreter(is_debugging, is_scripting, preset_input, \
+                              is_capturing, None, max_instructions)
+    program_statements, program_labels = MNE.compile_MN_program(program_source)
+    MNE.install_MN_labels(program_labels)
+    accelerators = install_loop_accelerators(program_statements, \
+                                             program_labels)
+    MNE.execute_MN_program(program_statements)
+    if MNE.debug:
+        MNE.print_debugging_information()
+    return accelerators
@@ -0,0 +1,161 @@
+#!/bin/python3
+
+import bisect
+import http.server
+import os
+import threading
+
+# Aggregate metrics for long-lived processes running many MN programs, such as
+# magic_number_daemon.py and magic_number_batch.py. Every run adds to a few
+# cheap counters and a latency histogram, which can be read as a Python object,
+# written to a file in the Prometheus text format or served over HTTP.
+#
+# Runs are recorded from the response objects of `run_program_request`, so
+# results computed in other processes are recorded just like local ones.
+
+# The upper bounds, in seconds, of the latency histogram's buckets. A last
+# bucket without an upper bound holds everything slower.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, \
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The counters taken from each response, and the descriptions they are exported
+# with.
+COUNTERS = {"instructions" : "Statements executed by MN programs.", \
+            "swallowed_errors" : "Exceptions swallowed by division and " \
+                                 "remainder instructions.", \
+            "underflows" : "Binary operations which found too few values " \
+                           "on the stack.", \
+            "input_reads" : "Lines of input read by MN programs.", \
+            "output_bytes" : "Bytes of output written by MN programs."}
+
+# Counters and a latency histogram covering every run recorded. All methods may
+# be called from any thread.
+class MNMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.runs = 0
+        self.failed_runs = 0
+        self.statuses = {}
+        self.counters = {name : 0 for name in COUNTERS}
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+
+    # Record a run from its response object.
+    def record(self, response):
+        with self.lock:
+            self.runs += 1
+            if "error" in response:
+                self.failed_runs += 1
+            else:
+                status = response.get("status")
+                self.statuses[status] = self.statuses.get(status, 0) + 1
+                for name in COUNTERS:
+                    self.counters[name] += response.get(name, 0)
+            if "elapsed" in response:
+                elapsed = response["elapsed"]
+                self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, \
+                                                      elapsed)] += 1
+                self.latency_sum += elapsed
+
+    # Estimate the latency below which the fraction `q` of runs fall, by
+    # interpolating within the histogram bucket holding that rank. Runs slower
+    # than the last bound are reported as taking the last bound.
+    def quantile(self, q):
+        with self.lock:
+            total = sum(self.bucket_counts)
+            if total == 0:
+                return 0.0
+            rank = q * total
+            seen = 0
+            for index, count in enumerate(self.bucket_counts):
+                if count > 0 and seen + count >= rank:
+                    if index == len(LATENCY_BUCKETS):
+                        return LATENCY_BUCKETS[-1]
+                    lower = LATENCY_BUCKETS[index - 1] if index > 0 else 0.0
+                    upper = LATENCY_BUCKETS[index]
+                    return lower + (upper - lower) * (rank - seen) / count
+                seen += count
+            return LATENCY_BUCKETS[-1]
+
+    # Return the metrics as a dictionary, with the median and 99th percentile
+    # latencies.
+    def as_dict(self):
+        p50 = self.quantile(0.5)
+        p99 = self.quantile(0.99)
+        with self.lock:
+            metrics = {"runs" : self.runs, "failed_runs" : self.failed_runs, \
+                       "statuses" : dict(self.statuses), \
+                       "latency_sum" : self.latency_sum, \
+                       "latency_p50" : p50, "latency_p99" : p99}
+            metrics.update(self.counters)
+        return metrics
+
+    # Return the metrics in the Prometheus text exposition format.
+    def prometheus_text(self):
+        with self.lock:
+            lines = ["# HELP mn_runs_total MN programs run.", \
+                     "# TYPE mn_runs_total counter", \
+                     "mn_runs_total {}".format(self.runs), \
+                     "# HELP mn_failed_runs_total MN programs which raised " \
+                     "an error.", \
+                     "# TYPE mn_failed_runs_total counter", \
+                     "mn_failed_runs_total {}".format(self.failed_runs), \
+                     "# HELP mn_run_status_total MN programs by how their " \
+                     "run ended.", \
+                     "# TYPE mn_run_status_total counter"]
+            for status, count in sorted(self.statuses.items()):
+                lines.append("mn_run_status_total{{status=\"{}\"}} {}" \
+                             .format(status, count))
+            for name, description in COUNTERS.items():
+                lines += ["# HELP mn_{}_total {}".format(name, description), \
+                          "# TYPE mn_{}_total counter".format(name), \
+                          "mn_{}_total {}".format(name, self.counters[name])]
+            lines += ["# HELP mn_run_latency_seconds Time taken by runs of " \
+                      "MN programs.", \
+                      "# TYPE mn_run_latency_seconds histogram"]
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, self.bucket_counts):
+                cumulative += count
+                lines.append("mn_run_latency_seconds_bucket{{le=\"{}\"}} {}" \
+                             .format(bound, cumulative))
+            cumulative += self.bucket_counts[-1]
+            lines += ["mn_run_latency_seconds_bucket{{le=\"+Inf\"}} {}" \
+                      .format(cumulative), \
+                      "mn_run_latency_seconds_sum {}" \
+                      .format(self.latency_sum), \
+                      "mn_run_latency_seconds_count {}".format(cumulative)]
+        return "\n".join(lines) + "\n"
+
+    # Write the metrics to a file in the Prometheus text format. The file is
+    # replaced in one step, so readers never see it half written.
+    def write_prometheus_file(self, path):
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w") as metrics_file:
+            metrics_file.write(self.prometheus_text())
+        os.replace(temporary_path, path)
+
+# Answers GET requests for /metrics with the metrics of the server.
+class MNMetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Scrapes are frequent, so they are not logged
+    def log_message(self, format, *arguments):
+        pass
+
+# Serve metrics over HTTP at /metrics from a background thread, on the local
+# machine only by default. Port 0 picks a free port. Return the server, whose
+# `server_address` holds the port and whose `shutdown` method stops it.
+def serve_metrics(metrics, port, host = "127.0.0.1"):
+    server = http.server.ThreadingHTTPServer((host, port), MNMetricsHandler)
+    server.metrics = metrics
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server
@@ -0,0 +1,182 @@
+#!/bin/python3
+
+import magic_number_executer as MNE
+import magic_number_loops as MNL
+
+# Whole-program optimization of MN programs over their control flow. Programs
+# often contain code which can never run, labels which nothing branches to, and
+# branches whose outcome is known in advance. The interpreter steps through all
+# of it, label no-ops included, so removing it saves both memory and steps. The
+# optimized program produces the same output and final stack as the original,
+# in fewer steps.
+#
+# Only 007 "create label" statements can be branched to, so every other
+# statement is entered from the one before it. In particular, a push directly
+# followed by a 008 "conditional branch" always branches on the pushed value.
+# The passes are:
+# - A branch to a label which is never declared, or declared where the branch
+#   would fall through to anyway, only pops its condition, so it becomes a 020
+#   "pop".
+# - A pushed constant which is popped straight away by a 020 "pop", or by a 008
+#   "conditional branch" on a falsy constant, is removed along with its pop.
+# - A branch on a truthy constant is an unconditional jump. A branch to a label
+#   whose code is only an unconditional jump is threaded through to the jump's
+#   own target.
+# - Statements which cannot be reached from the start of the program are
+#   removed, as are label declarations which no branch targets, including those
+#   overridden by a later declaration of the same label.
+# These are repeated until the program no longer changes.
+
+# Return true if a statement is a complete 007 "create label".
+def is_label_declaration(instruction):
+    return instruction[:3] == "007" and \
+           len(instruction) == MNE.INSTRUCTION_LENGTHS["007"]
+
+# Return true if a statement is a complete 008 "conditional branch".
+def is_branch(instruction):
+    return instruction[:3] == "008" and \
+           len(instruction) == MNE.INSTRUCTION_LENGTHS["008"]
+
+# Return the value pushed by a statement, or None if it is not a valid push.
+def pushed_constant(instruction):
+    opcode = instruction[:3]
+    if opcode not in ("001", "002") or \
+       len(instruction) != MNE.INSTRUCTION_LENGTHS[opcode]:
+        return None
+    return MNL.constant_value(instruction)
+
+# Return true if the statement before a branch makes it an unconditional jump.
+def is_unconditional(previous_instruction):
+    constant = pushed_constant(previous_instruction)
+    return constant is not None and MNE.isTrue(constant)
+
+# Return the label table of a list of statements, as `declare_MN_labels`
+# would build it: the last declaration of each label counts.
+def declare_labels(program_statements):
+    program_labels = {}
+    for statement_number, instruction in enumerate(program_statements):
+        if is_label_declaration(instruction):
+            program_labels[instruction[3:]] = statement_number
+    return program_labels
+
+# Return the statement execution falls through to after `statement_number`,
+# skipping label declarations.
+def fall_through_statement(program_statements, statement_number):
+    statement_number += 1
+    while statement_number < len(program_statements) and \
+          is_label_declaration(program_statements[statement_number]):
+        statement_number += 1
+    return statement_number
+
+# Rewrite branches which cannot change where execution goes as pops, and
+# remove constants which are popped as soon as they are pushed.
+def fold_constant_branches(program_statements):
+    program_labels = declare_labels(program_statements)
+    optimized = []
+    for statement_number, instruction in enumerate(program_statements):
+        if is_branch(instruction):
+            target = program_labels.get(instruction[3:])
+            if target is None or statement_number < target <= \
+               fall_through_statement(program_statements, statement_number):
+                instruction = "020"
+        if optimized and pushed_constant(optimized[-1]) is not None:
+            constant = pushed_constant(optimized[-1])
+            if instruction == "020" or \
+               is_branch(instruction) and not MNE.isTrue(constant):
+                optimized.pop()
+                continue
+        optimized.append(instruction)
+    return optimized
+
+# Return the label a branch to `label_name` finally arrives at, following
+# labels whose code is only an unconditional jump.
+def thread_label(program_statements, program_labels, label_name):
+    seen = {label_name}
+    while True:
+        # Skip the label and any others declared with it
+        index = fall_through_statement(program_statements, \
+                                       program_labels[label_name])
+        if index + 1 >= len(program_statements) or \
+           not is_unconditional(program_statements[index]) or \
+           not is_branch(program_statements[index + 1]):
+            return label_name
+        next_label = program_statements[index + 1][3:]
+        if next_label not in program_labels or next_label in seen:
+            return label_name
+        seen.add(next_label)
+        label_name = next_label
+
+# Point every branch at the end of the chain of jumps it starts.
+def thread_jumps(program_statements):
+    program_labels = declare_labels(program_statements)
+    optimized = []
+    for instruction in program_statements:
+        if is_branch(instruction) and instruction[3:] in program_labels:
+            instruction = "008" + thread_label(program_statements, \
+                                               program_labels, instruction[3:])
+        optimized.append(instruction)
+    return optimized
+
+# Remove statements which cannot be reached, and label declarations which no
+# remaining branch targets.
+def remove_dead_code(program_statements):
+    program_labels = declare_labels(program_statements)
+    reachable = set()
+    pending = [0]
+    while pending:
+        statement_number = pending.pop()
+        if statement_number in reachable or \
+           statement_number >= len(program_statements):
+            continue
+        reachable.add(statement_number)
+        instruction = program_statements[statement_number]
+        if not is_branch(instruction):
+            pending.append(statement_number + 1)
+            continue
+        target = program_labels.get(instruction[3:])
+        if target is not None:
+            pending.append(target)
+        if target is None or statement_number == 0 or \
+           not is_unconditional(program_statements[statement_number - 1]):
+            pending.append(statement_number + 1)
+    kept = [(statement_number, instruction) for statement_number, instruction \
+            in enumerate(program_statements) if statement_number in reachable]
+    targeted = {instruction[3:] for _, instruction in kept \
+                if is_branch(instruction)}
+    return [instruction for statement_number, instruction in kept \
+            if not is_label_declaration(instruction) or \
+               instruction[3:] in targeted and \
+               program_labels[instruction[3:]] == statement_number]
+
+# Optimize a list of program statements, returning the optimized list.
+def optimize_MN_statements(program_statements):
+    # A label declaration cut short by the end of the program fails before the
+    # program starts, which must not be optimized away
+    if program_statements and program_statements[-1][:3] == "007" and \
+       not is_label_declaration(program_statements[-1]):
+        return list(program_statements)
+    while True:
+        optimized = remove_dead_code(thread_jumps( \
+            fold_constant_branches(program_statements)))
+        if optimized == program_statements:
+            return optimized
+        program_statements = optimized
+
+# Optimize MN source code, returning the source of the optimized program.
+def optimize_MN_source(program_source):
+    return "".join(optimize_MN_statements( \
+        MNE.parse_MN_program_source(program_source)))
+
+# Compile and optimize MN source code, returning its statements and labels as
+# `compile_MN_program` does.
+def compile_optimized_MN_program(program_source):
+    program_statements, _ = MNE.compile_MN_program(program_source)
+    program_statements = optimize_MN_statements(program_statements)
+    return program_statements, declare_labels(program_statements)
+
+# A drop-in replacement for `run_interpreter_from_python` which optimizes the
+# program before running it.
+def run_optimized_MN_program(program_source, is_debugging, \
+                             is_scripting = False, preset_input = []):
+    MNE.run_interpreter_from_python(optimize_MN_source(program_source), \
+                                    is_debugging, is_scripting, preset_input)
@@ -0,0 +1,156 @@
+#!/bin/python3
+
+import struct
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+import magic_number_executer as MNE
+
+# Distribution of compiled MN programs to worker processes through shared
+# memory. Rather than pickling the statement list to every worker, the program
+# is decoded once into a flat binary block which workers attach to and execute
+# in place, so N workers share a single copy of the program.
+
+# The layout of the block is a header, followed by one fixed-width record per
+# statement, followed by one record per declared label:
+#   header:    magic "MNSP", format version, flags, statement count, label count
+#   statement: instruction length, instruction digits padded to 13 bytes
+#   label:     six-digit label name, statement number of the declaration
+HEADER = struct.Struct("<4sBBII")
+STATEMENT_RECORD = struct.Struct("<B13s")
+LABEL_RECORD = struct.Struct("<6sI")
+
+MAGIC = b"MNSP"
+FORMAT_VERSION = 2
+
+# Header flag set when processes other than the creator and its multiprocessing
+# workers attach to the program, each of which has a resource tracker of its own
+UNTRACK_ATTACHMENTS = 0x01
+
+# The most decoded statements a view of a shared program keeps at once
+STATEMENT_CACHE_SIZE = 4096
+
+# Shared programs this process has attached to, by shared memory name. Workers
+# running the same program repeatedly attach to it only once.
+attached_programs = {}
+
+# A read-only view of a compiled MN program stored in shared memory. The view
+# behaves like the statement list returned by `parse_MN_program_source`, so it
+# can be passed directly to `execute_MN_program`. Statements are decoded from
+# the block as they are fetched, and the most recently decoded ones are kept in
+# a small cache so that loops do not decode the same statements repeatedly.
+class SharedMNProgram:
+    def __init__(self, memory):
+        self.memory = memory
+        self.name = memory.name
+        magic, version, self.flags, self.statement_count, self.label_count = \
+            HEADER.unpack_from(memory.buf, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Shared memory block \"{}\" does not contain a " \
+                             "compiled MN program".format(memory.name))
+        self.labels_offset = HEADER.size + \
+                             self.statement_count * STATEMENT_RECORD.size
+        self.statement_cache = {}
+
+    def __len__(self):
+        return self.statement_count
+
+    def __getitem__(self, statement_number):
+        instruction = self.statement_cache.get(statement_number)
+        if instruction is None:
+            if not 0 <= statement_number < self.statement_count:
+                raise IndexError("statement number out of range")
+            length, instruction = STATEMENT_RECORD.unpack_from( \
+                self.memory.buf, \
+                HEADER.size + statement_number * STATEMENT_RECORD.size)
+            instruction = instruction[:length].decode("ascii")
+            if len(self.statement_cache) >= STATEMENT_CACHE_SIZE:
+                self.statement_cache.clear()
+            self.statement_cache[statement_number] = instruction
+        return instruction
+
+    # Return the label table stored alongside the statements.
+    def labels(self):
+        program_labels = {}
+        for index in range(self.label_count):
+            offset = self.labels_offset + index * LABEL_RECORD.size
+            name, statement_number = LABEL_RECORD.unpack_from(self.memory.buf,
+                                                              offset)
+            program_labels[name.decode("ascii")] = statement_number
+        return program_labels
+
+    # Detach this process from the block.
+    def close(self):
+        attached_programs.pop(self.name, None)
+        self.memory.close()
+
+    # Free the block. Only the process that created the program should do this,
+    # once every worker is finished with it.
+    def unlink(self):
+        self.memory.unlink()
+
+# Compile a MN program and copy it into a new shared memory block. The returned
+# program owns the block; its `name` is what workers pass to
+# `attach_shared_MN_program` or `run_shared_MN_program`. If processes other than
+# this one and its multiprocessing workers will attach to the program, pass
+# `outside_workers` as true, so that they remove the block from their own
+# resource trackers, which would otherwise free it when they exit.
+def share_MN_program(program_source, outside_workers = False):
+    program_statements, program_labels = \
+        MNE.compile_MN_program(program_source)
+    size = HEADER.size + len(program_statements) * STATEMENT_RECORD.size + \
+           len(program_labels) * LABEL_RECORD.size
+    memory = shared_memory.SharedMemory(create = True, size = size)
+    flags = UNTRACK_ATTACHMENTS if outside_workers else 0
+    HEADER.pack_into(memory.buf, 0, MAGIC, FORMAT_VERSION, flags,
+                     len(program_statements), len(program_labels))
+    offset = HEADER.size
+    for instruction in program_statements:
+        STATEMENT_RECORD.pack_into(memory.buf, offset, len(instruction),
+                                   instruction.encode("ascii"))
+        offset += STATEMENT_RECORD.size
+    for name, statement_number in program_labels.items():
+        LABEL_RECORD.pack_into(memory.buf, offset, name.encode("ascii"),
+                               statement_number)
+        offset += LABEL_RECORD.size
+    # The creator counts as attached, so that it never unregisters the block
+    program = SharedMNProgram(memory)
+    attached_programs[memory.name] = program
+    return program
+
+# Attach to a program shared by `share_MN_program`, reusing an existing
+# attachment made by this process.
+def attach_shared_MN_program(name):
+    if name not in attached_programs:
+        # Attaching processes must not unlink the block when they exit. Before
+        # Python 3.13, attaching registers the block with the resource
+        # tracker, which unlinks it at exit. The creator's multiprocessing
+        # workers share its tracker, which keeps a single registration that
+        # the creator removes on unlinking, but processes with trackers of
+        # their own unregister the block again when the creator says so.
+        if sys.version_info >= (3, 13):
+            memory = shared_memory.SharedMemory(name = name, track = False)
+            program = SharedMNProgram(memory)
+        else:
+            memory = shared_memory.SharedMemory(name = name)
+            program = SharedMNProgram(memory)
+            if program.flags & UNTRACK_ATTACHMENTS:
+                resource_tracker.unregister(memory._name, "shared_memory")
+        attached_programs[name] = program
+    return attached_programs[name]
+
+# Run a shared MN program, executing its statements directly from shared
+# memory. The arguments after the name are those of
+# `run_interpreter_from_python`.
+def run_shared_MN_program(name, is_debugging, is_scripting = False, \
+                          preset_input = []):
+    program = attach_shared_MN_program(name)
+    MNE.configure_interpreter(is_debugging, is_scripting, preset_input)
+    # Debug traces include the label declarations, as in a normal run
+    if is_debugging:
+        MNE.declare_MN_labels(program)
+    else:
+        MNE.install_MN_labels(program.labels())
+    MNE.execute_MN_program(program)
+    if MNE.debug:
+        MNE.print_debugging_information()
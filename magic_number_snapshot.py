@@ -0,0 +1,93 @@
+#!/bin/python3
+
+from collections import OrderedDict
+
+import magic_number_executer as MNE
+
+# Prefix snapshots. Many MN programs do a deterministic amount of work before
+# they first read input. That work is the same for every run, so it is executed
+# once, the state of the interpreter is saved just before the first read, and
+# later runs start from a copy of that state instead of from statement 0.
+
+# The opcodes of the instructions which read input: 003 "read float" and 004
+# "read string". Everything before the first of these is input-independent.
+INPUT_OPCODES = ("003", "004")
+
+# The number of snapshots kept by `run_interpreter_from_snapshot`. The least
+# recently used snapshot is discarded when there are more.
+SNAPSHOT_CACHE_SIZE = 64
+
+# Snapshots taken by `run_interpreter_from_snapshot`, keyed by program source
+# and debug flag, in least to most recently used order.
+snapshots = OrderedDict()
+
+# The saved state of the interpreter immediately before a program first reads
+# input, or at the end of the program if it never does. The statements executed
+# up to that point and the peak depth of the stack are saved too, so that runs
+# from the snapshot report the same statistics as full runs.
+class MNProgramSnapshot:
+    def __init__(self, program_statements, program_labels, is_debugging):
+        self.program_statements = program_statements
+        self.program_labels = program_labels
+        self.is_debugging = is_debugging
+        self.instruction_pointer = 0
+        self.stack = []
+        self.output = ""
+        self.instruction_trace = []
+        self.stack_history = []
+        self.instructions = 0
+        self.peak_stack_depth = 0
+
+# Execute a MN program up to, but not including, its first input instruction
+# and return a snapshot of the interpreter at that point. Output produced along
+# the way is captured in the snapshot rather than printed.
+def take_prefix_snapshot(program_source, is_debugging = False):
+    MNE.configure_interpreter(is_debugging, is_capturing = True)
+    program_statements, program_labels = \
+        MNE.compile_MN_program(program_source)
+    MNE.install_MN_labels(program_labels)
+    snapshot = MNProgramSnapshot(program_statements, program_labels,
+                                 is_debugging)
+    snapshot.instruction_pointer = MNE.execute_MN_program(program_statements,
+                                                          0, INPUT_OPCODES)
+    snapshot.stack = list(MNE.stack)
+    snapshot.output = MNE.get_captured_output()
+    snapshot.instruction_trace = list(MNE.instruction_trace)
+    snapshot.stack_history = list(MNE.stack_history)
+    snapshot.instructions = MNE.instructions_executed
+    snapshot.peak_stack_depth = MNE.peak_stack_depth
+    return snapshot
+
+# Run a MN program starting from a snapshot. The snapshot itself is never
+# modified; the interpreter is given its own copy of the saved state, so one
+# snapshot can serve any number of runs. The output the program produced before
+# the snapshot was taken is emitted first, exactly as a full run would have.
+def run_from_snapshot(snapshot, is_scripting = False, preset_input = [], \
+                      is_capturing = False, provider = None):
+    MNE.configure_interpreter(snapshot.is_debugging, is_scripting,
+                              preset_input, is_capturing, provider)
+    MNE.install_MN_labels(snapshot.program_labels)
+    MNE.stack = list(snapshot.stack)
+    MNE.instruction_trace = list(snapshot.instruction_trace)
+    MNE.stack_history = list(snapshot.stack_history)
+    MNE.instructions_executed = snapshot.instructions
+    MNE.peak_stack_depth = snapshot.peak_stack_depth
+    MNE.write_standard_output(snapshot.output)
+    MNE.execute_MN_program(snapshot.program_statements,
+                           snapshot.instruction_pointer)
+    if MNE.debug:
+        MNE.print_debugging_information()
+
+# A drop-in replacement for `run_interpreter_from_python` which takes a prefix
+# snapshot of each program the first time it is run and starts every later run
+# of the same program from that snapshot.
+def run_interpreter_from_snapshot(program_source, is_debugging, \
+                                  is_scripting = False, preset_input = []):
+    key = (program_source, is_debugging)
+    if key in snapshots:
+        snapshots.move_to_end(key)
+    else:
+        snapshots[key] = take_prefix_snapshot(program_source, is_debugging)
+        if len(snapshots) > SNAPSHOT_CACHE_SIZE:
+            snapshots.popitem(last = False)
+    run_from_snapshot(snapshots[key], is_scripting, preset_input)
@@ -0,0 +1,239 @@
+#!/bin/python3
+
+import math
+from collections import OrderedDict
+
+import magic_number_executer as MNE
+
+# Specialization of MN programs on known input. Everything a program does before
+# it needs input that is not yet known is executed ahead of time, including
+# whole loops, by running it in the ordinary interpreter, so the handlers'
+# silent underflows and swallowed exceptions behave exactly as in a real run.
+# What is left is a residual program: the output produced so far, the stack at
+# that point, and the statement at which execution resumes. A program which
+# never reads input, or reads only known input, is reduced to its output and
+# final stack.
+
+# The opcodes of the instructions which read input: 003 "read float" and 004
+# "read string".
+INPUT_OPCODES = ("003", "004")
+
+# The greatest number of statements executed ahead of time. Specialization stops
+# where it is when this runs out, so programs which loop forever or for a very
+# long time are specialized only partly.
+SPECIALIZATION_BUDGET = 1000000
+
+# Why specialization stopped, besides the termination statuses of the
+# interpreter. A specialization is "awaiting_input" when the program has read
+# every known line and is about to read another, and "failed" when the program
+# raised an exception, in which case nothing is executed ahead of time.
+AWAITING_INPUT = "awaiting_input"
+FAILED = "failed"
+
+# The exceptions which end a run of a MN program early.
+RUN_ERRORS = (Exception, MNE.StackUnderflowException, \
+              MNE.InvalidMNInstructionException, \
+              MNE.MisinterpretedInstructionException)
+
+# The number of specializations kept by `run_interpreter_from_specializer`. The
+# least recently used one is discarded when there are more.
+SPECIALIZATION_CACHE_SIZE = 64
+
+# Specializations made by `run_interpreter_from_specializer`, keyed by program
+# source, in least to most recently used order.
+specializations = OrderedDict()
+
+# A program specialized on a prefix of its input. Running `program_statements`
+# from `instruction_pointer` with `stack`, after printing `output`, behaves as
+# running the whole program would once the `consumed_input` known lines have
+# been read, and the `instructions` statements before that point executed, with
+# the stack at most `peak_stack_depth` values deep.
+# Specialization may stop before reading every known line, and the lines it did
+# not read are kept in `remaining_input`. `program_labels` is None if declaring
+# the program's labels fails.
+class SpecializedProgram:
+    def __init__(self, program_statements, program_labels, known_input = []):
+        self.program_statements = program_statements
+        self.program_labels = program_labels
+        self.instruction_pointer = 0
+        self.stack = []
+        self.output = ""
+        self.status = FAILED
+        self.consumed_input = 0
+        self.remaining_input = list(known_input)
+        self.instructions = 0
+        self.peak_stack_depth = 0
+
+# Specialize a MN program on the known first lines of its input. If a result
+# cache is given, completed specializations are stored in it, and a cached
+# result makes executing the program unnecessary.
+def specialize_MN_program(program_source, known_input = [], \
+                          result_cache = None, \
+                          max_instructions = SPECIALIZATION_BUDGET):
+    try:
+        program_statements, program_labels = \
+            MNE.compile_MN_program(program_source)
+    except RUN_ERRORS:
+        # Declaring the labels fails, as it will when the program is run, so
+        # keep the statements and declare their labels then
+        return SpecializedProgram(MNE.parse_MN_program_source(program_source), \
+                                  None, known_input)
+    specialized = SpecializedProgram(program_statements, program_labels, \
+                                     known_input)
+    if result_cache is not None:
+        cached = result_cache.get(program_source, known_input)
+        if cached is not None:
+            specialized.output, specialized.stack, statistics = cached
+            specialized.stack = list(specialized.stack)
+            specialized.instructions = statistics.get("instructions", 0)
+            specialized.peak_stack_depth = \
+                statistics.get("peak_stack_depth", 0)
+            specialized.instruction_pointer = len(program_statements)
+            specialized.status = MNE.COMPLETED
+            specialized.remaining_input = []
+            return specialized
+    MNE.configure_interpreter(False, True, known_input, True, None, \
+                              max_instructions, None, True)
+    MNE.install_MN_labels(program_labels)
+    instruction_pointer = 0
+    status = MNE.COMPLETED
+    try:
+        while True:
+            instruction_pointer = MNE.execute_MN_program(program_statements, \
+                                                         instruction_pointer, \
+                                                         INPUT_OPCODES)
+            status = MNE.termination_status
+            if status != MNE.COMPLETED or \
+               instruction_pointer >= len(program_statements):
+                break
+            # Stopped at a read. Carry it out if its line is known.
+            if MNE.input_provider.position >= len(known_input):
+                status = AWAITING_INPUT
+                break
+            MNE.execute_MN_program(program_statements[instruction_pointer : \
+                                                      instruction_pointer + 1])
+            instruction_pointer += 1
+    except RUN_ERRORS:
+        # The program fails at some point, and must fail at the same point
+        # when it is really run, so leave it all for then
+        return specialized
+    specialized.instruction_pointer = instruction_pointer
+    specialized.stack = list(MNE.stack)
+    specialized.output = MNE.get_captured_output()
+    specialized.status = status
+    specialized.consumed_input = MNE.input_provider.position
+    specialized.remaining_input = list(known_input[specialized.consumed_input:])
+    specialized.instructions = MNE.instructions_executed
+    specialized.peak_stack_depth = MNE.peak_stack_depth
+    if result_cache is not None and status == MNE.COMPLETED:
+        result_cache.put(program_source, known_input, specialized.output, \
+                         specialized.stack, \
+                         {"instructions" : specialized.instructions, \
+                          "peak_stack_depth" : specialized.peak_stack_depth})
+    return specialized
+
+# Run a specialized program. `preset_input` is the input following the known
+# lines it was specialized on, and is read after any known lines specialization
+# did not reach. The statements executed ahead of time are counted in the run
+# statistics and charged to an instruction budget, which covers the whole
+# program.
+def run_specialized_program(specialized, is_scripting = False, \
+                            preset_input = [], is_capturing = False, \
+                            max_instructions = None):
+    preset_input = specialized.remaining_input + list(preset_input)
+    MNE.configure_interpreter(False, is_scripting, preset_input, is_capturing, \
+                              None, max_instructions)
+    if specialized.program_labels is None:
+        MNE.declare_MN_labels(specialized.program_statements)
+    else:
+        MNE.install_MN_labels(specialized.program_labels)
+    MNE.stack = list(specialized.stack)
+    MNE.instructions_executed = specialized.instructions
+    MNE.peak_stack_depth = specialized.peak_stack_depth
+    MNE.write_standard_output(specialized.output)
+    MNE.execute_MN_program(specialized.program_statements, \
+                           specialized.instruction_pointer)
+
+# A drop-in replacement for `run_interpreter_from_python` which specializes each
+# program the first time it is run and starts every later run of the same
+# program from its specialization. Debugging runs need the full instruction
+# trace, so they are not specialized.
+def run_interpreter_from_specializer(program_source, is_debugging, \
+                                     is_scripting = False, preset_input = []):
+    if is_debugging:
+        MNE.run_interpreter_from_python(program_source, is_debugging, \
+                                        is_scripting, preset_input)
+        return
+    if program_source in specializations:
+        specializations.move_to_end(program_source)
+    else:
+        specializations[program_source] = specialize_MN_program(program_source)
+        if len(specializations) > SPECIALIZATION_CACHE_SIZE:
+            specializations.popitem(last = False)
+    run_specialized_program(specializations[program_source], is_scripting, \
+                            preset_input)
+
+# Return the source of an instruction pushing exactly `value`, or None if no
+# 001 "push integer" or 002 "push float" instruction does.
+def push_value_source(value):
+    if not math.isfinite(value) or value == 0 and math.copysign(1, value) < 0:
+        return None
+    if value == int(value) and abs(value) <= 999999:
+        sign = "1" if value < 0 else "0"
+        return "001" + sign + "{:06d}".format(abs(int(value)))
+    # Find a mantissa and exponent which `push_float` turns into the value
+    for exponent in range(-99, 100):
+        mantissa = round(value / 10 ** exponent)
+        if abs(mantissa) <= 999999 and \
+           float(mantissa * 10 ** exponent) == value:
+            exponent_sign = "1" if exponent < 0 else "0"
+            mantissa_sign = "1" if mantissa < 0 else "0"
+            return "002" + exponent_sign + "{:02d}".format(abs(exponent)) + \
+                   mantissa_sign + "{:06d}".format(abs(mantissa))
+    return None
+
+# Return the source of instructions printing a character.
+def print_char_source(character):
+    code = ord(character)
+    if code <= 999999:
+        return push_value_source(code) + "006"
+    # Larger code points are pushed as a sum
+    return push_value_source(999999) + push_value_source(code - 999999) + \
+           "016006"
+
+# Return a label name which no statement of a program declares or branches to.
+def unused_label(program_statements):
+    used = {statement[3:] for statement in program_statements \
+            if statement[:3] in ("007", "008")}
+    for number in range(1000000):
+        name = "{:06d}".format(number)
+        if name not in used:
+            return name
+    return None
+
+# Return the source of the residual program of a specialization: a MN program
+# which prints the output produced ahead of time, rebuilds the stack, and jumps
+# to where execution resumes, so that run on the input following its
+# `consumed_input` known lines it behaves as the original program. Return None
+# if some value on the stack cannot be pushed exactly by a MN instruction.
+def residual_source(specialized):
+    program_statements = specialized.program_statements
+    instruction_pointer = specialized.instruction_pointer
+    if instruction_pointer == 0 and not specialized.output and \
+       not specialized.stack:
+        return "".join(program_statements)
+    pushes = [push_value_source(value) for value in specialized.stack]
+    if None in pushes:
+        return None
+    prelude = "".join(print_char_source(character) \
+                      for character in specialized.output) + "".join(pushes)
+    if instruction_pointer >= len(program_statements):
+        return prelude
+    # Mark the statement to resume at with a new label and branch to it. The
+    # statements before it stay, since later branches may lead back to them.
+    label = unused_label(program_statements)
+    if label is None:
+        return None
+    return prelude + "0010000001" + "008" + label + \
+           "".join(program_statements[:instruction_pointer]) + "007" + label + \
+           "".join(program_statements[instruction_pointer:])
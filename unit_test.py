@@ -1,7 +1,35 @@
 # Some tests for the Magic Number interpreter.
 
 import magic_number_executer as MNE
+import magic_number_shared_program as MNSP
+import magic_number_snapshot as MNSS
+import magic_number_cache as MNC
+import magic_number_generator as MNG
+import magic_number_daemon as MND
+import magic_number_daemon_client as MNDC
+import magic_number_batch as MNB
+import magic_number_incremental as MNI
+import magic_number_specializer as MNPE
+import magic_number_metrics as MNM
+import magic_number_loops as MNL
+import magic_number_optimizer as MNO
+import magic_number_fuzzer as MNF
+import json
+from benchmarks import suite as benchmark_suite
+import contextlib
+import io
+import multiprocessing
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+import unittest.mock
+import urllib.request
 
 # Ensure that the stack contains the proper values after executing various
 # instructions.
@@ -339,7 +367,920 @@ class BooleanTesting(unittest.TestCase):
         """Test duplicate"""
         MNE.run_interpreter_from_python("00100000010210010000002021021", True)
         self.assertEqual(MNE.stack, [1.0, 1.0, 2.0, 2.0, 2.0])
-        
+
+# Run a shared program in a worker process and hand back its final stack.
+def run_shared_program_in_worker(name, preset_input):
+    MNSP.run_shared_MN_program(name, False, True, preset_input)
+    return MNE.stack
+
+class SharedProgramTesting(unittest.TestCase):
+    def setUp(self):
+        self.program = MNSP.share_MN_program("00100000020070000010210011" + \
+                                             "000001016021008000001003")
+    def tearDown(self):
+        self.program.close()
+        self.program.unlink()
+    def test_shared_statements_match_parse(self):
+        """Test that a shared program decodes to the parsed statements"""
+        statements = MNE.parse_MN_program_source("00100000020070000010210" + \
+                                                 "011000001016021008000001003")
+        self.assertEqual(list(self.program), statements)
+        self.assertEqual(self.program.labels(), {"000001": 1})
+    def test_run_shared_program(self):
+        """Test running a shared program in this process"""
+        MNSP.run_shared_MN_program(self.program.name, True, True, ["4.5"])
+        self.assertEqual(MNE.stack, [2.0, 1.0, 0.0, 4.5, 1.0])
+    def test_debug_trace_matches_full_run(self):
+        """Test that a debug run records label declarations as usual"""
+        MNE.run_interpreter_from_python("00100000020070000010210011" + \
+                                        "000001016021008000001003", True, \
+                                        True, ["4.5"])
+        expected = (MNE.instruction_trace, MNE.stack_history)
+        MNSP.run_shared_MN_program(self.program.name, True, True, ["4.5"])
+        self.assertEqual((MNE.instruction_trace, MNE.stack_history), expected)
+    def test_block_survives_attaching_process(self):
+        """Test that a process which attaches does not free the block"""
+        program = MNSP.share_MN_program("003020005", True)
+        try:
+            script = "import magic_number_shared_program as MNSP; " + \
+                     "MNSP.attach_shared_MN_program({!r})".format(program.name)
+            directory = os.path.dirname(os.path.abspath(MNSP.__file__))
+            subprocess.run([sys.executable, "-c", script], \
+                           capture_output = True, cwd = directory, check = True)
+            memory = MNSP.shared_memory.SharedMemory(name = program.name)
+            self.assertEqual(list(MNSP.SharedMNProgram(memory)), \
+                             ["003", "020", "005"])
+            memory.close()
+        finally:
+            program.close()
+            program.unlink()
+    def test_run_shared_program_in_workers(self):
+        """Test running a shared program in several worker processes"""
+        with multiprocessing.Pool(2) as pool:
+            stacks = pool.starmap(run_shared_program_in_worker, \
+                                  [(self.program.name, ["1"]), \
+                                   (self.program.name, ["2"])])
+        self.assertEqual(stacks, [[2.0, 1.0, 0.0, 1.0, 1.0], \
+                                  [2.0, 1.0, 0.0, 2.0, 1.0]])
+
+class SnapshotTesting(unittest.TestCase):
+    # Print "Hi", read two floats, add them and print the sum
+    PROGRAM = "0010000105001000007200600600302000302001600" + "5"
+    def test_snapshot_stops_before_first_read(self):
+        """Test that a prefix snapshot stops at the first input instruction"""
+        snapshot = MNSS.take_prefix_snapshot(self.PROGRAM)
+        self.assertEqual(snapshot.instruction_pointer, 4)
+        self.assertEqual(snapshot.output, "Hi")
+        self.assertEqual(snapshot.stack, [])
+    def test_runs_from_snapshot_match_full_runs(self):
+        """Test that runs from one snapshot match full runs"""
+        snapshot = MNSS.take_prefix_snapshot(self.PROGRAM, True)
+        for preset_input in [["1", "2"], ["0.5", "-3"], ["7", "x"]]:
+            MNE.run_interpreter_from_python(self.PROGRAM, True, True, \
+                                            list(preset_input))
+            expected = (MNE.printed_output, MNE.stack, MNE.instruction_trace)
+            MNSS.run_from_snapshot(snapshot, True, list(preset_input))
+            self.assertEqual((MNE.printed_output, MNE.stack, \
+                              MNE.instruction_trace), expected)
+    def test_statistics_match_full_runs(self):
+        """Test that runs from a snapshot count the statements before it"""
+        MNE.run_interpreter_from_python(self.PROGRAM, False, True, ["1", "2"])
+        expected = (MNE.instructions_executed, MNE.peak_stack_depth)
+        MNSS.run_from_snapshot(MNSS.take_prefix_snapshot(self.PROGRAM), True, \
+                               ["1", "2"])
+        self.assertEqual((MNE.instructions_executed, MNE.peak_stack_depth), \
+                         expected)
+    def test_snapshot_of_program_without_input(self):
+        """Test a snapshot of a program which never reads input"""
+        MNSS.run_interpreter_from_snapshot("0010000001005", True)
+        MNSS.run_interpreter_from_snapshot("0010000001005", True)
+        self.assertEqual(MNE.printed_output, "1.0")
+
+class ResultCacheTesting(unittest.TestCase):
+    # Read two floats and push their sum
+    PROGRAM = "003020003020016"
+    def test_cache_hit_restores_stack(self):
+        """Test that a cached run leaves the same stack as a real run"""
+        cache = MNC.MNResultCache()
+        MNE.run_interpreter_from_python(self.PROGRAM, False, True, \
+                                        ["1", "2"], cache)
+        MNE.run_interpreter_from_python(self.PROGRAM, False, True, \
+                                        ["1", "2"], cache)
+        self.assertEqual(MNE.stack, [3.0])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+    def test_cache_distinguishes_input(self):
+        """Test that runs with different input are cached separately"""
+        cache = MNC.MNResultCache()
+        MNE.run_interpreter_from_python(self.PROGRAM, False, True, \
+                                        ["1", "2"], cache)
+        MNE.run_interpreter_from_python(self.PROGRAM, False, True, \
+                                        ["1", "3"], cache)
+        self.assertEqual(MNE.stack, [4.0])
+        self.assertEqual(cache.hits, 0)
+    def test_output_printed_before_failure(self):
+        """Test that a failing cached run still prints its output"""
+        cache = MNC.MNResultCache()
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed), \
+             self.assertRaises(MNE.OutOfScriptedInputException):
+            MNE.run_interpreter_from_python("0010000065006003", False, True, \
+                                            [], cache)
+        self.assertEqual(printed.getvalue(), "A")
+        self.assertEqual(cache.misses, 1)
+        self.assertIsNone(cache.get("0010000065006003", []))
+    def test_cache_evicts_least_recently_used(self):
+        """Test LRU eviction of the in-memory cache"""
+        cache = MNC.MNResultCache(max_entries = 2)
+        cache.put("1", [], "a", [])
+        cache.put("2", [], "b", [])
+        cache.get("1", [])
+        cache.put("3", [], "c", [])
+        self.assertIsNone(cache.get("2", []))
+        self.assertEqual(cache.get("1", []), ("a", [], {}))
+    def test_cache_persists_to_disk(self):
+        """Test that results survive in the on-disk store"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.sqlite")
+            cache = MNC.MNResultCache(path = path)
+            cache.put(self.PROGRAM, ["1", "2"], "", [3.0])
+            cache.close()
+            cache = MNC.MNResultCache(path = path)
+            self.assertEqual(cache.get(self.PROGRAM, ["1", "2"]), \
+                             ("", [3.0], {}))
+            cache.close()
+    def test_disk_hits_are_written_in_batches(self):
+        """Test that reading a result from disk does not write at once"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.sqlite")
+            cache = MNC.MNResultCache(path = path)
+            cache.put(self.PROGRAM, ["1", "2"], "", [3.0])
+            cache.close()
+            def last_used():
+                with contextlib.closing(sqlite3.connect(path)) as database:
+                    return database.execute("SELECT last_used FROM " \
+                                            "results").fetchone()[0]
+            stored = last_used()
+            cache = MNC.MNResultCache(path = path)
+            cache.get(self.PROGRAM, ["1", "2"])
+            self.assertEqual(last_used(), stored)
+            cache.close()
+            self.assertGreater(last_used(), stored)
+    def test_cache_hit_restores_statistics(self):
+        """Test that a cached run reports the statistics of a real run"""
+        cache = MNC.MNResultCache()
+        MNE.run_interpreter_from_python(self.PROGRAM, False, True, \
+                                        ["1", "2"], cache)
+        expected = (MNE.instructions_executed, MNE.peak_stack_depth)
+        MNE.run_interpreter_from_python(self.PROGRAM, False, True, \
+                                        ["1", "2"], cache)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual((MNE.instructions_executed, MNE.peak_stack_depth), \
+                         expected)
+
+class InputProviderTesting(unittest.TestCase):
+    # Read two strings and print them back
+    PROGRAM = "004020006006006004020006006"
+    def test_scripted_input_is_not_consumed(self):
+        """Test that scripted input lists are read without being modified"""
+        preset_input = ["abc", "de"]
+        MNE.run_interpreter_from_python(self.PROGRAM, True, True, preset_input)
+        self.assertEqual(MNE.printed_output, "abcde")
+        self.assertEqual(preset_input, ["abc", "de"])
+    def test_iterator_provider(self):
+        """Test reading input lines from a file-like iterator"""
+        provider = MNE.IteratorInputProvider(io.StringIO("abc\r\nde\n"))
+        MNE.run_interpreter_from_python(self.PROGRAM, True, \
+                                        input_provider = provider)
+        self.assertEqual(MNE.printed_output, "abcde")
+    def test_stream_provider_splits_blocks(self):
+        """Test a stream provider whose blocks end in the middle of lines"""
+        provider = MNE.StreamInputProvider(io.StringIO("abc\nde"), 2)
+        self.assertEqual(provider.next_line(), "abc")
+        self.assertEqual(provider.next_line(), "de")
+        self.assertRaises(EOFError, provider.next_line)
+    def test_stream_provider_end_of_input(self):
+        """Test reading a string after the end of a stream"""
+        provider = MNE.StreamInputProvider(io.StringIO(""))
+        MNE.run_interpreter_from_python("004", True, input_provider = provider)
+        self.assertEqual(MNE.stack, [0.0])
+
+class BenchmarkTesting(unittest.TestCase):
+    def test_benchmark_workload_on_every_engine(self):
+        """Test benchmarking a small program on every engine"""
+        workload = benchmark_suite.Workload("adder", "Add\n003020003020016005", \
+                                            ["1", "2"])
+        results = benchmark_suite.benchmark_workload(workload, \
+            list(benchmark_suite.ENGINES), 1)
+        self.assertEqual(results["source_digits"], 18)
+        self.assertEqual(set(results["engines"]), set(benchmark_suite.ENGINES))
+        self.assertEqual(results["engines"]["reference"]["instructions"], 6)
+        self.assertIn("debug_overhead", results["engines"]["reference"])
+    def test_engines_count_every_instruction(self):
+        """Test that engines starting part way count what was run before"""
+        workload = benchmark_suite.Workload("hello", "0010000072006" * 3, [])
+        engine_names = ["reference", "snapshot", "shared_memory", \
+                        "specialized", "loop_accelerated"]
+        results = benchmark_suite.benchmark_workload(workload, engine_names, \
+                                                     1, False)
+        for engine_name in engine_names:
+            self.assertEqual(results["engines"][engine_name]["instructions"], \
+                             6)
+    def test_regression_detection(self):
+        """Test that slowdowns beyond the tolerance are reported"""
+        def results(instructions_per_second, parse_seconds):
+            return {"version" : benchmark_suite.RESULTS_VERSION, \
+                    "workloads" : {"loop" : {"parse_seconds" : parse_seconds, \
+                    "engines" : {"reference" : {"instructions_per_second" : \
+                    instructions_per_second}}}}}
+        baseline = results(1000.0, 1.0)
+        self.assertEqual(benchmark_suite.compare_to_baseline( \
+            results(950.0, 1.05), baseline), [])
+        self.assertEqual(len(benchmark_suite.compare_to_baseline( \
+            results(800.0, 1.5), baseline)), 2)
+
+class GeneratorTesting(unittest.TestCase):
+    # Run a program, returning everything it printed.
+    def run_program(self, source, input_lines):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            MNE.run_interpreter_from_python(source, False, True, input_lines)
+        return output.getvalue()
+    def test_every_shape_produces_expected_output(self):
+        """Test that generated programs print their expected output"""
+        for shape in MNG.SHAPES:
+            workload = MNG.generate_workload(shape, 2048, 7)
+            self.assertGreaterEqual(len(workload.source), 1900, shape)
+            source = "".join(char for char in workload.source \
+                             if char in "0123456789")
+            self.assertEqual(self.run_program(source, workload.input_lines), \
+                             workload.expected_output, shape)
+    def test_generation_is_reproducible(self):
+        """Test that a seed always produces the same program"""
+        first = MNG.generate_workload("input_heavy", 1024, 3)
+        second = MNG.generate_workload("input_heavy", 1024, 3)
+        self.assertEqual((first.source, first.input_lines), \
+                         (second.source, second.input_lines))
+    def test_write_workload(self):
+        """Test writing a workload and its sidecar files to disk"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "deep.magic")
+            MNG.write_workload(path, "stack_deep", 4096, 1)
+            with open(path + ".expected") as expected_file:
+                expected_output = expected_file.read()
+            source = MNE.load_MN_file(path)
+        self.assertEqual(self.run_program(source, []), expected_output)
+
+class DaemonTesting(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.directory.name, "mn.sock")
+        self.daemon = MND.MNDaemon(self.socket_path)
+        self.thread = threading.Thread(target = self.daemon.serve_forever)
+        self.thread.start()
+    def tearDown(self):
+        if not self.daemon.shutdown_requested:
+            self.daemon.shutdown()
+        self.thread.join()
+        self.daemon.server_close()
+        self.directory.cleanup()
+    def test_run_program_by_path(self):
+        """Test running a sample program through the daemon"""
+        with MNDC.MNDaemonClient(self.socket_path) as client:
+            response = client.run("adder.magic", input_lines = ["3", "4"])
+        self.assertEqual(response["output"], "7.0")
+        self.assertEqual(response["stack"], [])
+        self.assertEqual(response["instructions"], 6)
+    def test_programs_stay_compiled(self):
+        """Test that repeated requests reuse the compiled program"""
+        with MNDC.MNDaemonClient(self.socket_path) as client:
+            for value in ["1", "2", "3"]:
+                response = client.run(source = "Read 003 020 and print 005", \
+                                      input_lines = [value])
+                self.assertEqual(response["output"], str(float(value)))
+            stats = client.request({"command" : "stats"})
+        self.assertEqual((stats["program_cache_hits"], \
+                          stats["program_cache_misses"]), (2, 1))
+    def test_errors_are_reported(self):
+        """Test that a failed run is reported without stopping the daemon"""
+        with MNDC.MNDaemonClient(self.socket_path) as client:
+            response = client.run(source = "003", input_lines = [])
+            self.assertIn("OutOfScriptedInputException", response["error"])
+            self.assertEqual(client.run(source = "0010000001")["stack"], [1.0])
+    def test_idle_client_does_not_block(self):
+        """Test that an idle connection does not hold up other clients"""
+        with MNDC.MNDaemonClient(self.socket_path), \
+             MNDC.MNDaemonClient(self.socket_path) as client:
+            self.assertEqual(client.run(source = "0010000001")["stack"], [1.0])
+    def test_input_must_be_a_list(self):
+        """Test that input given as a string is rejected"""
+        with MNDC.MNDaemonClient(self.socket_path) as client:
+            response = client.request({"source" : "004", "input" : "abc"})
+        self.assertIn("\"input\"", response["error"])
+    def test_socket_path_in_use(self):
+        """Test that files and live sockets are not replaced"""
+        with self.assertRaises(FileExistsError):
+            MND.MNDaemon(self.socket_path)
+        file_path = os.path.join(self.directory.name, "not_a_socket")
+        with open(file_path, "w") as regular_file:
+            regular_file.write("keep me")
+        with self.assertRaises(FileExistsError):
+            MND.MNDaemon(file_path)
+        self.assertTrue(os.path.exists(file_path))
+    def test_stale_socket_replaced(self):
+        """Test that a socket nothing listens on is replaced"""
+        stale_path = os.path.join(self.directory.name, "stale.sock")
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(stale_path)
+        stale.close()
+        daemon = MND.MNDaemon(stale_path)
+        daemon.server_close()
+    def test_client_from_pipeline(self):
+        """Test the command line client reading input from a pipe"""
+        client_path = os.path.abspath(MNDC.__file__)
+        completed = subprocess.run([sys.executable, client_path, "run", \
+                                    self.socket_path, "adder.magic"], \
+                                   input = "3\n4\n", capture_output = True, \
+                                   text = True, check = True)
+        self.assertEqual(completed.stdout, "7.0")
+    def test_client_does_not_load_interpreter(self):
+        """Test that the client starts without importing the interpreter"""
+        client_path = os.path.abspath(MNDC.__file__)
+        script = "import sys, magic_number_daemon_client; " + \
+                 "print(sorted(name for name in sys.modules " + \
+                 "if name.startswith('magic_number')))"
+        completed = subprocess.run([sys.executable, "-c", script], \
+                                   cwd = os.path.dirname(client_path), \
+                                   capture_output = True, text = True, \
+                                   check = True)
+        self.assertEqual(completed.stdout, "['magic_number_daemon_client']\n")
+    def test_shutdown(self):
+        """Test stopping the daemon with a request"""
+        with MNDC.MNDaemonClient(self.socket_path) as client:
+            client.request({"command" : "shutdown"})
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+
+# Run a batch job in a worker process, killing the worker if the job asks to.
+def run_job_or_crash(job, run_job = MNB.run_job):
+    if job.get("crash"):
+        os._exit(1)
+    return run_job(job)
+
+class BatchTesting(unittest.TestCase):
+    JOBS = "\n".join([json.dumps({"id" : "a", "path" : "adder.magic", \
+                                  "input" : ["1", "2"]}), \
+                      "not json", \
+                      json.dumps({"source" : "003 020 005", "input" : ["5"]}), \
+                      json.dumps({"id" : "c", "source" : "003 020 005", \
+                                  "input" : ["6"]})]) + "\n"
+    def run_jobs(self, workers):
+        output = io.StringIO()
+        jobs_run = MNB.run_batch(io.StringIO(self.JOBS), output, workers, 2)
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        return jobs_run, results
+    def test_batch_in_process(self):
+        """Test running a batch of jobs in this process"""
+        jobs_run, results = self.run_jobs(0)
+        self.assertEqual(jobs_run, 3)
+        self.assertEqual([result.get("id") for result in results], \
+                         ["a", None, 3, "c"])
+        self.assertEqual(results[0]["output"], "3.0")
+        self.assertEqual(results[1]["line"], 2)
+        self.assertEqual(results[3]["output"], "6.0")
+    def test_batch_in_workers(self):
+        """Test running a batch of jobs in worker processes"""
+        jobs_run, results = self.run_jobs(2)
+        self.assertEqual(jobs_run, 3)
+        outputs = {result.get("id") : result.get("output") \
+                   for result in results}
+        self.assertEqual(outputs, {"a" : "3.0", None : None, 3 : "5.0", \
+                                   "c" : "6.0"})
+    def test_batch_survives_worker_crash(self):
+        """Test that a worker crash fails only the job which caused it"""
+        jobs = [{"id" : n, "source" : "003 020 005", "input" : [str(n)]} \
+                for n in range(8)]
+        jobs[3]["crash"] = True
+        output = io.StringIO()
+        with unittest.mock.patch.object(MNB, "run_job", run_job_or_crash):
+            jobs_run = MNB.run_batch( \
+                io.StringIO("".join(json.dumps(job) + "\n" for job in jobs)), \
+                output, 2, 4)
+        self.assertEqual(jobs_run, 8)
+        results = {result["id"] : result for result in \
+                   map(json.loads, output.getvalue().splitlines())}
+        self.assertEqual(sorted(results), list(range(8)))
+        self.assertIn("worker process crashed", results[3]["error"])
+        for n in range(8):
+            if n != 3:
+                self.assertEqual(results[n]["output"], "{}.0".format(n))
+
+class IncrementalParseTesting(unittest.TestCase):
+    # Pieces of random programs, chosen to contain many labels and branches
+    PIECES = ["007000001", "007000002", "008000001", "0010000001", "016", \
+              "021", "5", "00", "12"]
+    def random_source(self, rng, pieces):
+        return "".join(rng.choice(self.PIECES) for _ in range(pieces))
+    def test_random_edits_match_full_parse(self):
+        """Test that random edits give the same result as a full parse"""
+        rng = random.Random(2017)
+        program = MNI.IncrementalMNProgram(self.random_source(rng, 1000))
+        for _ in range(200):
+            offset = rng.randint(0, len(program.source))
+            removed_length = rng.randint(0, min(12, len(program.source) - \
+                                                offset))
+            program.apply_edit(offset, removed_length, \
+                               self.random_source(rng, rng.randint(0, 3)))
+            statements = MNE.parse_MN_program_source(program.source)
+            self.assertEqual(program.statements, statements)
+            labels = {statement[3:] : number for number, statement in \
+                      enumerate(statements) \
+                      if MNI.is_label_declaration(statement)}
+            self.assertEqual(program.labels, labels)
+    def test_random_edits_at_checkpoints(self):
+        """Test edits near checkpoints and the end against a full parse"""
+        # Runs of 005 stay out of step for long after a digit is inserted
+        pieces = ["005", "005", "005", "005", "007000001", "1", "5"]
+        def random_source(pieces_count):
+            return "".join(rng.choice(pieces) for _ in range(pieces_count))
+        rng = random.Random(12)
+        with unittest.mock.patch.object(MNI, "CHECKPOINT_INTERVAL", 4):
+            program = MNI.IncrementalMNProgram(random_source(100))
+            for _ in range(300):
+                offset = rng.choice([rng.randint(0, len(program.source)), \
+                                     len(program.source), 0])
+                removed_length = min(rng.randint(0, 6), \
+                                     len(program.source) - offset)
+                if rng.random() < 0.1:
+                    removed_length = len(program.source) - offset
+                program.apply_edit(offset, removed_length, \
+                                   random_source(rng.randint(0, 8)))
+                statements = MNE.parse_MN_program_source(program.source)
+                self.assertEqual(program.statements, statements)
+                labels = {statement[3:] : number for number, statement in \
+                          enumerate(statements) \
+                          if MNI.is_label_declaration(statement)}
+                self.assertEqual(program.labels, labels)
+    def test_truncated_tail_is_not_a_checkpoint(self):
+        """Test appending after an edit which left a fragment at the end"""
+        program = MNI.IncrementalMNProgram("005" * 300)
+        program.apply_edit(768, len(program.source) - 768, "")
+        program.apply_edit(0, 0, "1")
+        program.apply_edit(len(program.source), 0, "005")
+        self.assertEqual(program.statements, \
+                         MNE.parse_MN_program_source(program.source))
+    def test_edit_reports_changed_statements(self):
+        """Test the statements reported as changed by an edit"""
+        program = MNI.IncrementalMNProgram("0010000001" "016" "021" "005")
+        self.assertEqual(program.apply_edit(10, 3, "017"), (1, 1, 1))
+        self.assertEqual(program.statements, \
+                         ["0010000001", "017", "021", "005"])
+    def test_truncated_label_fails_to_run(self):
+        """Test that a label declaration cut short fails as in a full run"""
+        program_source = "0010000072005" "00712"
+        with self.assertRaises(MNE.InvalidMNInstructionException):
+            MNE.run_interpreter_from_python(program_source, False, True)
+        program = MNI.IncrementalMNProgram(program_source)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            with self.assertRaises(MNE.InvalidMNInstructionException):
+                program.run(False, True)
+            program.apply_edit(len(program.source), 0, "3456")
+            program.run(False, True)
+        self.assertEqual(output.getvalue(), "72.0")
+    def test_label_table_is_patched(self):
+        """Test that edits patch the label table rather than replace it"""
+        program = MNI.IncrementalMNProgram("007000001" "007000002" "005" \
+                                           "007000001")
+        labels = program.labels
+        program.apply_edit(18, 0, "0010000001")
+        program.apply_edit(28, 12, "")
+        self.assertIs(program.labels, labels)
+        self.assertEqual(labels, {"000001" : 0, "000002" : 1})
+    def test_debug_trace_matches_full_run(self):
+        """Test that a debug run records label declarations as usual"""
+        program_source = "007000001" "0010000001" "005"
+        MNE.run_interpreter_from_python(program_source, True)
+        expected = (MNE.instruction_trace, MNE.stack_history)
+        MNI.IncrementalMNProgram(program_source).run(True)
+        self.assertEqual((MNE.instruction_trace, MNE.stack_history), expected)
+    def test_comments_in_edits_are_ignored(self):
+        """Test that typing a comment does not change the program"""
+        program = MNI.IncrementalMNProgram("0010000001005")
+        self.assertEqual(program.apply_edit(10, 0, "print it"), (1, 0, 0))
+        program.run(True)
+        self.assertEqual(MNE.printed_output, "1.0")
+
+class LoopDetectionTesting(unittest.TestCase):
+    # Push 1 and branch back to the label forever, without input or output
+    SILENT_LOOP = "007000001" "0010000001" "008000001"
+    def test_silent_loop_is_detected(self):
+        """Test that a loop without input or output is stopped"""
+        output = MNE.run_compiled_MN_program( \
+            *MNE.compile_MN_program(self.SILENT_LOOP), detect_loops = True)
+        self.assertEqual(output, "")
+        self.assertEqual(MNE.termination_status, MNE.INFINITE_LOOP)
+    def test_terminating_loops_complete(self):
+        """Test that loops which end are not mistaken for infinite loops"""
+        workload = MNG.generate_workload("nested_loops", 256, \
+                                         iterations = 20)
+        output = MNE.run_compiled_MN_program( \
+            *MNE.compile_MN_program(MNE.strip_MN_source(workload.source)), \
+            detect_loops = True)
+        self.assertEqual(output, workload.expected_output)
+        self.assertEqual(MNE.termination_status, MNE.COMPLETED)
+    def test_instruction_budget(self):
+        """Test that a truth machine printing forever is stopped by a budget"""
+        program = MNE.compile_MN_program( \
+            MNE.load_MN_file("truth_machine.magic"))
+        output = MNE.run_compiled_MN_program(*program, ["1"], \
+                                             max_instructions = 1000, \
+                                             detect_loops = True)
+        self.assertEqual(MNE.termination_status, \
+                         MNE.INSTRUCTION_BUDGET_EXHAUSTED)
+        self.assertEqual(MNE.instructions_executed, 1000)
+        self.assertTrue(output.startswith("1.01.01.0"))
+    def test_time_budget(self):
+        """Test that a silent loop is stopped by a time budget"""
+        MNE.run_compiled_MN_program(*MNE.compile_MN_program(self.SILENT_LOOP), \
+                                    max_seconds = 0.05)
+        self.assertEqual(MNE.termination_status, MNE.TIME_BUDGET_EXHAUSTED)
+    def test_budgeted_runs_are_not_cached(self):
+        """Test that runs stopped early do not fill the result cache"""
+        cache = MNC.MNResultCache()
+        with contextlib.redirect_stdout(io.StringIO()):
+            MNE.run_interpreter_from_python(self.SILENT_LOOP, False, True, [], \
+                                            cache, detect_loops = True)
+        self.assertEqual(len(cache.entries), 0)
+    def test_request_options(self):
+        """Test run options given in daemon and batch requests"""
+        programs = MNC.MNProgramCache()
+        response = MND.run_program_request({"source" : self.SILENT_LOOP, \
+            "options" : {"max_instructions" : 50}}, programs)
+        self.assertEqual(response["status"], MNE.INSTRUCTION_BUDGET_EXHAUSTED)
+        self.assertEqual(response["instructions"], 50)
+        response = MND.run_program_request({"source" : "005", \
+            "options" : {"max_heap" : 5}}, programs)
+        self.assertIn("error", response)
+
+class SpecializerTesting(unittest.TestCase):
+    # Programs and inputs, with every prefix of the input used as known input
+    RUNS = [("hello_world.magic", []), ("adder.magic", ["3", "4.5"]), \
+            ("fizz_buzz.magic", ["15"]), ("prime.magic", ["97"]), \
+            ("truth_machine.magic", ["0"])]
+    def run_program(self, program_source, preset_input):
+        statements, labels = MNE.compile_MN_program(program_source)
+        output = MNE.run_compiled_MN_program(statements, labels, preset_input)
+        return output, list(MNE.stack)
+    def test_truncated_label_falls_back(self):
+        """Test that a program whose labels cannot be declared still runs"""
+        program_source = "0010000065006" "0070001"
+        specialized = MNPE.specialize_MN_program(program_source)
+        self.assertEqual(specialized.status, MNPE.FAILED)
+        with self.assertRaises(MNE.InvalidMNInstructionException):
+            MNPE.run_specialized_program(specialized, True, [], True)
+        self.assertEqual(MNE.get_captured_output(), "")
+    def test_unread_known_input_is_kept(self):
+        """Test a specialization stopped before reading its known input"""
+        program_source = "0010005000" "007000001" "0011000001" "016" "021" + \
+                         "008000001" "003" "005"
+        specialized = MNPE.specialize_MN_program(program_source, ["42"], \
+                                                 None, 100)
+        self.assertEqual(specialized.consumed_input, 0)
+        self.assertEqual(specialized.remaining_input, ["42"])
+        expected = self.run_program(program_source, ["42"])
+        expected_instructions = MNE.instructions_executed
+        MNPE.run_specialized_program(specialized, True, [], True)
+        self.assertEqual((MNE.get_captured_output(), MNE.stack), expected)
+        self.assertEqual(MNE.instructions_executed, expected_instructions)
+    def test_specialized_runs_match_full_runs(self):
+        """Test that specialized and residual programs behave as originals"""
+        for file_name, preset_input in self.RUNS:
+            program_source = MNE.load_MN_file(file_name)
+            expected = self.run_program(program_source, preset_input)
+            for known in range(len(preset_input) + 1):
+                specialized = MNPE.specialize_MN_program(program_source, \
+                                                         preset_input[:known])
+                MNPE.run_specialized_program(specialized, True, \
+                                             preset_input[known:], True)
+                self.assertEqual((MNE.get_captured_output(), MNE.stack), \
+                                 expected)
+                residual = MNPE.residual_source(specialized)
+                self.assertEqual(self.run_program(residual, \
+                                                  preset_input[known:]), \
+                                 expected)
+    def test_input_free_program_is_reduced_to_output(self):
+        """Test that a program without input is reduced to its output"""
+        program_source = MNE.load_MN_file("hello_world.magic")
+        cache = MNC.MNResultCache()
+        specialized = MNPE.specialize_MN_program(program_source, [], cache)
+        self.assertEqual(specialized.status, MNE.COMPLETED)
+        self.assertEqual(specialized.output, "Hello, world!\n")
+        self.assertEqual(cache.get(program_source, []), \
+                         ("Hello, world!\n", [], \
+                          {"instructions" : specialized.instructions, \
+                           "peak_stack_depth" : specialized.peak_stack_depth}))
+        residual = MNPE.residual_source(specialized)
+        opcodes = {statement[:3] for statement in \
+                   MNE.parse_MN_program_source(residual)}
+        self.assertEqual(opcodes, {"001", "006"})
+    def test_specialization_stops_at_unknown_input(self):
+        """Test that specialization stops at the first unknown read"""
+        specialized = MNPE.specialize_MN_program( \
+            MNE.load_MN_file("adder.magic"), ["3"])
+        self.assertEqual(specialized.status, MNPE.AWAITING_INPUT)
+        self.assertEqual(specialized.consumed_input, 1)
+        self.assertEqual(specialized.program_statements[ \
+            specialized.instruction_pointer], "003")
+    def test_inexact_stacks_have_no_residual(self):
+        """Test that a stack holding infinity has no residual program"""
+        specialized = MNPE.specialize_MN_program("0020990999999" * 3 + \
+                                                 "018018")
+        self.assertEqual(specialized.stack, [float("inf")])
+        self.assertIsNone(MNPE.residual_source(specialized))
+    def test_push_value_source(self):
+        """Test that pushed values are exact"""
+        for value in [0.0, -7.0, 999999.0, 1e6, 0.1, -2.5e-7, 123456e99]:
+            MNE.run_interpreter_from_python(MNPE.push_value_source(value), \
+                                            False)
+            self.assertEqual(MNE.stack, [value])
+        self.assertIsNone(MNPE.push_value_source(-0.0))
+        self.assertIsNone(MNPE.push_value_source(1 / 3))
+
+class MetricsTesting(unittest.TestCase):
+    # Divide by zero, underflow an addition, print "é" and read a bad float
+    PROGRAM = "0010000000" "0010000001" "019" "016" "0010000233" "006" "003"
+    def test_run_statistics(self):
+        """Test the counters describing a run"""
+        MNE.run_compiled_MN_program(*MNE.compile_MN_program(self.PROGRAM), \
+                                    ["x"])
+        self.assertEqual(MNE.get_run_statistics(), \
+                         {"status" : MNE.COMPLETED, "instructions" : 7, \
+                          "swallowed_errors" : 1, "underflows" : 1, \
+                          "input_reads" : 1, "output_bytes" : 2})
+    def test_lone_surrogate_output(self):
+        """Test that printing a lone surrogate is counted, not an error"""
+        output = MNE.run_compiled_MN_program( \
+            *MNE.compile_MN_program("0010055296006"))
+        self.assertEqual(output, "\ud800")
+        self.assertEqual(MNE.get_run_statistics()["output_bytes"], 3)
+        response = MND.run_program_request({"source" : "0010055296006"}, \
+                                           MNC.MNProgramCache())
+        self.assertEqual(response["output"], "\ud800")
+    def test_latency_quantiles(self):
+        """Test latency quantiles estimated from the histogram"""
+        metrics = MNM.MNMetrics()
+        for _ in range(99):
+            metrics.record({"status" : MNE.COMPLETED, "elapsed" : 0.0002})
+        metrics.record({"error" : "failed", "elapsed" : 3.0})
+        self.assertTrue(0.0001 <= metrics.quantile(0.5) <= 0.00025)
+        self.assertTrue(2.5 <= metrics.quantile(0.999) <= 5.0)
+        self.assertEqual(metrics.as_dict()["failed_runs"], 1)
+    def test_batch_metrics_over_http(self):
+        """Test metrics of a batch served in the Prometheus format"""
+        metrics = MNM.MNMetrics()
+        jobs = json.dumps({"source" : self.PROGRAM, "input" : ["x"]}) + "\n"
+        MNB.run_batch(io.StringIO(jobs * 3), io.StringIO(), metrics = metrics)
+        server = MNM.serve_metrics(metrics, 0)
+        try:
+            url = "http://127.0.0.1:{}/metrics".format(server.server_address[1])
+            with urllib.request.urlopen(url) as response:
+                text = response.read().decode("utf-8")
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn("mn_runs_total 3\n", text)
+        self.assertIn("mn_swallowed_errors_total 3\n", text)
+        self.assertIn("mn_output_bytes_total 6\n", text)
+        self.assertIn("mn_run_latency_seconds_count 3\n", text)
+        self.assertIn("mn_run_status_total{status=\"completed\"} 3\n", text)
+
+class StackLimitTesting(unittest.TestCase):
+    # Push 1, then duplicate it forever
+    GROWING = "0010000001" "007000001" "021" "0010000001" "008000001"
+    def run_growing(self, **limits):
+        return MNE.run_compiled_MN_program( \
+            *MNE.compile_MN_program(self.GROWING), max_instructions = 10000, \
+            **limits)
+    def test_peak_stack_depth(self):
+        """Test the peak depth of the stack"""
+        MNE.run_interpreter_from_python("0010000001" "021" "021" "020" "020", \
+                                        True)
+        statistics = MNE.get_memory_statistics()
+        self.assertEqual(statistics["peak_stack_depth"], 3)
+        self.assertGreater(statistics["trace_bytes"], 0)
+    def test_stop_at_stack_limit(self):
+        """Test that a program is stopped at its stack limit"""
+        self.run_growing(max_stack = 100)
+        self.assertEqual(MNE.termination_status, MNE.STACK_LIMIT_EXCEEDED)
+        self.assertEqual(len(MNE.stack), 100)
+        self.assertEqual(MNE.get_memory_statistics()["peak_stack_depth"], 100)
+    def test_drop_oldest_at_stack_limit(self):
+        """Test that the bottom of the stack is dropped at its stack limit"""
+        self.run_growing(max_stack = 100, stack_policy = "drop_oldest")
+        self.assertEqual(MNE.termination_status, \
+                         MNE.INSTRUCTION_BUDGET_EXHAUSTED)
+        self.assertEqual(MNE.stack, [1.0] * 100)
+        self.assertGreater(MNE.stack_values_dropped, 0)
+    def test_drop_oldest_keeps_top_values(self):
+        """Test which values are left when the bottom of the stack is dropped"""
+        program_source = "".join("001{:07d}".format(value) \
+                                 for value in range(1, 6))
+        MNE.run_compiled_MN_program(*MNE.compile_MN_program(program_source), \
+                                    max_stack = 3, \
+                                    stack_policy = "drop_oldest")
+        self.assertEqual(MNE.stack, [3.0, 4.0, 5.0])
+        self.assertEqual(MNE.stack_values_dropped, 2)
+    def test_peak_stack_bytes(self):
+        """Test that stack memory is measured at the peak depth"""
+        MNE.run_interpreter_from_python("0010000001" "021" "021", False)
+        full = MNE.get_memory_statistics()["peak_stack_bytes"]
+        MNE.run_interpreter_from_python("0010000001" "021" "021" "020" "020", \
+                                        False)
+        self.assertEqual(MNE.get_memory_statistics()["peak_stack_bytes"], full)
+        self.assertGreater(full, 3 * MNE.STACK_VALUE_BYTES)
+    def test_stack_limit_is_not_swallowed(self):
+        """Test that a string read does not swallow the stack limit"""
+        MNE.run_compiled_MN_program(*MNE.compile_MN_program("004"), ["abc"], \
+                                    max_stack = 2)
+        self.assertEqual(MNE.termination_status, MNE.STACK_LIMIT_EXCEEDED)
+        self.assertEqual(MNE.stack, [99.0, 98.0])
+
+class LoopAccelerationTesting(unittest.TestCase):
+    # Count down from 5000 to zero
+    COUNTDOWN = "0010005000" "007000001" "0011000001" "016" "021" "008000001"
+    # Double a value until it is at least 1000, with dead arithmetic on the way
+    DOUBLING = "0010000001" "007000001" "0010000002" "018" "0010000007" "020" \
+               "021" "0010001000" "014" "008000001"
+    # Pieces of random programs, chosen to contain many small loops
+    PIECES = ["007000001", "007000002", "008000001", "008000002", \
+              "0010000001", "0011000001", "0010000003", "0021010000005", \
+              "016", "017", "018", "020", "021", "009", "010", "013", "015", \
+              "005", "0011000001016021"]
+    def run_both(self, program_source, max_instructions = None):
+        results = []
+        reference = MNE.run_compiled_MN_program( \
+            *MNE.compile_MN_program(program_source), \
+            max_instructions = max_instructions)
+        results.append((reference, MNE.stack, MNE.termination_status, \
+                        MNE.instructions_executed, MNE.peak_stack_depth))
+        accelerators = MNL.run_accelerated_MN_program(program_source, False, \
+                                                      True, [], True, \
+                                                      max_instructions)
+        results.append((MNE.get_captured_output(), MNE.stack, \
+                        MNE.termination_status, MNE.instructions_executed, \
+                        MNE.peak_stack_depth))
+        self.assertEqual(results[0], results[1])
+        return MNL.report_accelerated_loops(accelerators)
+    def test_counting_loop_in_closed_form(self):
+        """Test that a countdown is run in closed form"""
+        report = self.run_both(self.COUNTDOWN)
+        self.assertEqual(MNE.stack, [0.0])
+        self.assertEqual(MNE.accelerated_instructions, 5000 * 5)
+        self.assertEqual(report, [{"label" : "000001", "start" : 1, \
+                                   "end" : 5, "kind" : "closed_form", \
+                                   "runs" : 1, "iterations" : 5000}])
+    def test_loop_as_recurrence(self):
+        """Test that a loop with a computed condition runs as a recurrence"""
+        report = self.run_both(self.DOUBLING)
+        self.assertEqual(MNE.stack, [1024.0])
+        self.assertEqual(report[0]["kind"], "recurrence")
+        self.assertEqual(report[0]["iterations"], 10)
+    def test_budgets_are_honoured(self):
+        """Test that accelerated loops stop where budgets run out"""
+        for budget in [1, 7, 2000, 24999, 25001]:
+            self.run_both(self.COUNTDOWN, budget)
+    def test_loops_with_output_are_not_accelerated(self):
+        """Test that loops printing their output are left alone"""
+        program = MNE.compile_MN_program( \
+            MNE.load_MN_file("truth_machine.magic"))
+        self.assertEqual(MNL.find_loop_accelerators(*program), {})
+    def test_debugging_is_not_accelerated(self):
+        """Test that debug runs see every statement"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            MNL.run_accelerated_MN_program(self.COUNTDOWN, True)
+        self.assertEqual(MNE.accelerated_instructions, 0)
+        self.assertEqual(MNE.instructions_executed, 5000 * 5 + 1)
+    def test_random_loops_match_reference(self):
+        """Test that random programs give the same results accelerated"""
+        rng = random.Random(39)
+        for _ in range(300):
+            program_source = "".join(rng.choice(self.PIECES) \
+                                     for _ in range(rng.randint(1, 20)))
+            self.run_both(program_source, rng.choice([50, 500, 5000]))
+
+class OptimizerTesting(unittest.TestCase):
+    # Pieces of random programs, chosen to contain many jumps and dead code
+    PIECES = ["007000001", "007000002", "007000003", "008000001", \
+              "008000002", "008000004", "0010000001", "0011000001", \
+              "0010000000", "0020000000000", "016", "020", "021", "010", \
+              "005", "003", "019", "0010000001008000001", \
+              "0010000001008000002", "0010000000008000003"]
+    def run_program(self, program_statements, program_labels):
+        try:
+            output = MNE.run_compiled_MN_program(program_statements, \
+                                                 program_labels, ["5", "x"], \
+                                                 max_instructions = 2000)
+        except MNE.OutOfScriptedInputException:
+            output = MNE.get_captured_output() + " (out of input)"
+        return output, MNE.stack, MNE.termination_status
+    def test_dead_code_and_labels_removed(self):
+        """Test that unreachable code and untargeted labels are removed"""
+        program_source = "007000009" "0010000001" "008000001" "005" "005" \
+                         "007000001" "0010000002" "005"
+        self.assertEqual(MNO.optimize_MN_source(program_source), \
+                         "0010000002" "005")
+    def test_constant_branches_folded(self):
+        """Test branches on constants and to missing labels"""
+        self.assertEqual(MNO.optimize_MN_source("0010000000" "008000001" \
+                                                "0010000003" "008000002" \
+                                                "005"), "005")
+    def test_jumps_threaded(self):
+        """Test that a branch to a jump is pointed at the jump's target"""
+        program_source = "003" "008000001" "0010000001" "008000003" \
+                         "007000002" "0010000007" "005" \
+                         "0010000001" "008000004" \
+                         "007000001" "0010000001" "008000002" \
+                         "007000003" "0010000008" "005" "007000004"
+        optimized = MNO.optimize_MN_source(program_source)
+        self.assertEqual(optimized, "003" "008000002" "0010000001" \
+                                    "008000003" "007000002" "0010000007" \
+                                    "005" "0010000001" "008000004" \
+                                    "007000003" "0010000008" "005" \
+                                    "007000004")
+    def test_truncated_label_is_kept(self):
+        """Test that a program failing to declare a label is not changed"""
+        self.assertEqual(MNO.optimize_MN_source("005" "0070001"), \
+                         "005" "0070001")
+    def test_random_programs_match_reference(self):
+        """Test that optimized programs give the same results in fewer steps"""
+        rng = random.Random(40)
+        for _ in range(300):
+            program_source = "".join(rng.choice(self.PIECES) \
+                                     for _ in range(rng.randint(1, 20)))
+            expected = self.run_program(*MNE.compile_MN_program( \
+                program_source))
+            if expected[2] != MNE.COMPLETED:
+                continue
+            steps = MNE.instructions_executed
+            self.assertEqual(self.run_program( \
+                *MNO.compile_optimized_MN_program(program_source)), expected)
+            self.assertLessEqual(MNE.instructions_executed, steps)
+    def test_optimize_option(self):
+        """Test that requests may ask for their program to be optimized"""
+        programs = MNC.MNProgramCache()
+        request = {"source" : "007000001 0010000004 005", \
+                   "options" : {"optimize" : True}}
+        response = MND.run_program_request(request, programs)
+        self.assertEqual(response["output"], "4.0")
+        self.assertEqual(response["instructions"], 2)
+
+class FuzzerTesting(unittest.TestCase):
+    # An engine which gets every program with a 018 "multiply" wrong
+    def broken_engine(self, case, max_instructions):
+        outcome = MNF.run_reference(case, max_instructions)
+        if "018" in MNE.parse_MN_program_source(case.source):
+            outcome.output += "!"
+        return outcome
+    def test_cases_are_reproducible(self):
+        """Test that a case is generated the same from its seed and number"""
+        first = MNF.generate_case(41, 7)
+        second = MNF.generate_case(41, 7)
+        self.assertEqual((first.source, first.input_lines, first.known_lines), \
+                         (second.source, second.input_lines, \
+                          second.known_lines))
+        self.assertNotEqual(first.source, MNF.generate_case(41, 8).source)
+    def test_engines_match_reference(self):
+        """Test that no engine differs from the reference on random programs"""
+        report = MNF.fuzz(300, 41)
+        self.assertEqual(report.cases, 300)
+        self.assertEqual(report.mismatches, [])
+        self.assertEqual(report.compared["shared_memory"], 300)
+        self.assertGreater(report.compared["optimized"], 0)
+    def test_workers(self):
+        """Test that worker processes run the same cases"""
+        report = MNF.fuzz(300, 41, ("loop_accelerated", "optimized"), 2)
+        expected = MNF.fuzz(300, 41, ("loop_accelerated", "optimized"))
+        self.assertEqual(report.compared, expected.compared)
+        self.assertEqual(report.mismatches, [])
+    def test_mismatch_shrunk(self):
+        """Test that a mismatch is found and shrunk to a minimal program"""
+        with unittest.mock.patch.dict(MNF.EXACT_ENGINES, \
+                                      {"broken" : self.broken_engine}):
+            report = MNF.fuzz_batch(41, 0, 100, ("broken",))
+        self.assertGreater(len(report.mismatches), 0)
+        mismatch = report.mismatches[0]
+        self.assertEqual(mismatch["engine"], "broken")
+        self.assertEqual(mismatch["actual"]["output"], \
+                         mismatch["expected"]["output"] + "!")
+        self.assertEqual(mismatch["shrunk_source"], "018")
+    def test_delta_debugging(self):
+        """Test shrinking a program to the statements a failure needs"""
+        program_source = "0010000003" "021" "0010000004" "016" "005" "021"
+        shrunk = MNF.shrink_program(program_source, \
+            lambda source: "016" in MNE.parse_MN_program_source(source) and \
+                           "005" in MNE.parse_MN_program_source(source))
+        self.assertEqual(shrunk, "016005")
+
 if __name__ == "__main__":
     unittest.main()
  